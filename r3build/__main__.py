@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
+import asyncio
 import time
 import click
+from r3build.aio import AsyncR3build
 from r3build.cli import R3build
 from r3build.processor import available_processors
 
@@ -21,12 +23,26 @@ class ConfigOption(click.types.StringParamType):
     '-v', '--verbose', help='Verbose mode (equivalent to `log.all = true` in config)', is_flag=True
 )
 @click.option('--list-types', help='List available job types', is_flag=True)
-def main(config, verbose, list_types):
+@click.option(
+    '--engine',
+    default='thread',
+    help='Core implementation to run jobs. (default = thread)',
+    type=click.Choice(['thread', 'asyncio']),
+)
+def main(config, verbose, list_types, engine):
     if list_types:
         print('Available Job Types (a.k.a. processor IDs):')
         print(''.join(f'* {i}\n' for i in available_processors.keys() if i != 'internaltest'))
         return
 
+    if engine == 'asyncio':
+        r3 = AsyncR3build(config_fn=config, verbose=verbose)
+        try:
+            asyncio.run(r3.serve())
+        except KeyboardInterrupt:
+            pass
+        return
+
     r3 = R3build(config_fn=config, verbose=verbose)
     r3.run()
 
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from multiprocessing import cpu_count
+from typing import Optional
+
+from watchdog.events import FileSystemEvent, FileSystemEventHandler
+from watchdog.observers import Observer
+
+from r3build.cli import R3build
+from r3build.prompter import Prompter
+from r3build.watcher import EventBuffer
+
+
+class _QueueHandler(FileSystemEventHandler):
+    """Forwards events from the observer thread to an asyncio.Queue."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        super().__init__()
+        self.loop = loop
+        self.queue = queue
+
+    def on_any_event(self, event):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+class AsyncR3build(R3build):
+    """The asyncio-native core of r3build.
+
+    It shares the config, jobs and routing with R3build, but runs on an
+    asyncio event loop instead of the watcher thread and the thread pool.
+    Events go from the observer to an asyncio.Queue, jobs await their
+    processes, and daemons are stopped by awaiting their exit.
+
+    It can be embedded in asyncio applications:
+
+        r3 = AsyncR3build(config_fn='r3build.toml')
+        task = asyncio.create_task(r3.serve())
+        ...
+        task.cancel()  # stops the jobs and closes the processors
+    """
+
+    observer: Observer
+    prompter: Prompter
+    event_buffer: EventBuffer
+    queue: Optional[asyncio.Queue]
+
+    def __init__(self, config_fn=None, config_dict=None, verbose=False):
+        super().__init__(config_fn=config_fn, config_dict=config_dict, verbose=verbose)
+        self.observer = Observer()
+        self.prompter = Prompter(self.config)
+        self.event_buffer = EventBuffer(self.config.event.rate_limit_duration)
+        self.queue = None
+
+    async def serve(self):
+        """Open the processors, watch the paths and dispatch events until it gets cancelled."""
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.config.event.concurrency or cpu_count())
+
+        for job in self.config.job:
+            await job.processor.open_async()
+            job.bind_loop(loop, semaphore)
+
+        handler = _QueueHandler(loop, self.queue)
+        for path in {job.path for job in self.config.job}:
+            self.observer.schedule(handler, path, recursive=True)
+        self.observer.start()
+
+        if self.snapshot:
+            events = await loop.run_in_executor(None, self.snapshot.catch_up)
+            self.prompter.procsay('Snapshot', f'{len(events)} changes since the last run')
+            if events:
+                now = time.monotonic()
+                self.dispatch([(event, now) for event in events])
+
+        try:
+            await self._dispatch_loop()
+        finally:
+            self.observer.stop()
+            await self.close_async()
+
+    async def _dispatch_loop(self):
+        while True:
+            deadline = self.event_buffer.next_deadline()
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                self.dispatch(self.event_buffer.drain_ready(time.monotonic()))
+                continue
+            self._push(event)
+
+    def _push(self, event: FileSystemEvent):
+        if not self.event_buffer.push(event):
+            if self.config.log.ignored_events:
+                self.prompter.ignore("Watcher", "ratelimit", event)
+            return
+        if self.config.log.accepted_events:
+            self.prompter.accept(event)
+
+    def run(self):
+        raise RuntimeError('AsyncR3build runs on an event loop; await serve() instead')
+
+    def close(self):
+        raise RuntimeError('AsyncR3build runs on an event loop; await close_async() instead')
+
+    async def close_async(self):
+        tasks = [task for job in self.config.job for task in job.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for job in self.config.job:
+            await job.processor.close_async()
+        if self.snapshot:
+            await asyncio.get_running_loop().run_in_executor(None, self.snapshot.save)
+        if self.jobserver:
+            self.jobserver.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,53 @@
+import asyncio
+
+from r3build.aio import AsyncR3build
+
+
+def test_serve(tmp_path):
+    jobs = [
+        {
+            'name': 'glob',
+            'type': 'internaltest',
+            'path': str(tmp_path),
+            'glob': '*.txt',
+            'when': ['created', 'modified'],
+        },
+        {
+            'name': 'command',
+            'type': 'command',
+            'path': str(tmp_path),
+            'glob': '*.txt',
+            'when': 'created',
+            'command': f'echo $R3_FILENAME >> {tmp_path / "log"}',
+        },
+        {
+            'name': 'daemon',
+            'type': 'daemon',
+            'path': str(tmp_path),
+            'glob': '*.py',
+            'command': 'sleep 100',
+        },
+    ]
+    r3 = AsyncR3build(config_dict={'job': jobs, 'log': {'all': True}})
+
+    async def _main():
+        task = asyncio.create_task(r3.serve())
+        await asyncio.sleep(0.5)
+        daemon = r3.get_job('daemon').processor
+        pid = daemon._child_process.pid
+
+        (tmp_path / 'foo.txt').write_text('mikumiku')
+        (tmp_path / 'app.py').write_text('')
+        await asyncio.sleep(1)
+
+        assert daemon._child_process.pid != pid
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert daemon._child_process is None
+
+    asyncio.run(_main())
+
+    history = r3.get_job('glob').processor.history
+    assert [e.src_path for e in history] == [str(tmp_path / 'foo.txt')] * len(history)
+    assert {e.event_type for e in history} <= {'created', 'modified'}
+    assert (tmp_path / 'log').read_text().split() == [str(tmp_path / 'foo.txt')]
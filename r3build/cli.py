@@ -1,10 +1,18 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from typing import Optional
 
 import tomlkit
 
 from r3build import watcher
 from r3build.config import Config
+from r3build.jobserver import JobServer
+from r3build.matcher import Matcher
 from r3build.prompter import Prompter
+from r3build.router import Router
+from r3build.snapshot import Snapshot
 
 
 class R3build:
@@ -23,6 +31,10 @@ class R3build:
 
     watcher: watcher.Watcher
     config: Config
+    router: Router
+    executor: ThreadPoolExecutor
+    snapshot: Optional[Snapshot]
+    jobserver: Optional[JobServer]
 
     def __init__(self, config_fn=None, config_dict=None, verbose=False):
         # Load the config from toml
@@ -43,31 +55,80 @@ class R3build:
         raw["log"] = log
 
         self.config = Config(raw)
+        self.router = Router(self.config.job)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.config.event.concurrency or cpu_count(),
+            thread_name_prefix='r3build-job',
+        )
         self.watcher = watcher.Watcher(self.config, Prompter(self.config))
 
+        self.snapshot = None
+        if self.config.event.snapshot:
+            self.snapshot = Snapshot(
+                self.config.event.snapshot,
+                {job.path for job in self.config.job},
+                use_hash=self.config.event.snapshot_hash,
+            )
+
+        self.jobserver = None
+        if self.config.event.jobserver:
+            self.jobserver = JobServer(self.config.event.jobserver_slots or cpu_count())
+            for job in self.config.job:
+                job.processor.jobserver = self.jobserver
+
     def run(self):
         for job in self.config.job:
             job.processor.open()
+            job.executor = self.executor
 
         # Register paths to watch
         paths = {job.path for job in self.config.job}
         for path in paths:
             self.watcher.add_path(path)
 
-        # Callback for filesystem events
-        def _invoke(event):
-            accepted = False
-            for job in self.config.job:
-                accepted |= job.trigger(event)
-            return accepted
-
         # Register callback and start asynchronous watcher
-        self.watcher.callback = _invoke
+        self.watcher.callback = self.dispatch
         self.watcher.start()
 
+        if self.snapshot:
+            self.catch_up()
+
+    def catch_up(self):
+        """Dispatch synthetic events for the changes made since the snapshot was saved."""
+        events = self.snapshot.catch_up()
+        Prompter(self.config).procsay('Snapshot', f'{len(events)} changes since the last run')
+        if events:
+            now = time.monotonic()
+            self.dispatch([(event, now) for event in events])
+
+    def dispatch(self, ready):
+        """Callback for filesystem events.
+
+        It takes pairs of an event and its timestamp that got ready at once,
+        and launches the jobs that accept them. Returns if any job accepted them.
+        """
+        accepted = dict()
+        for event, timestamp in ready:
+            abspath = Matcher.normalize(event.src_path)
+            for job in self.router.route(abspath):
+                if job.trigger(event, abspath, timestamp, defer=True):
+                    accepted[id(job)] = job
+
+        # Launch events that got ready at once as a batch
+        for job in accepted.values():
+            job.flush()
+        return bool(accepted)
+
     def close(self):
+        for job in self.config.job:
+            job.processor.cancel()
+        self.executor.shutdown(wait=True)
         for job in self.config.job:
             job.processor.close()
+        if self.snapshot:
+            self.snapshot.save()
+        if self.jobserver:
+            self.jobserver.close()
 
     def get_job(self, name):
         for job in self.config.job:
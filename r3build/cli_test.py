@@ -1,3 +1,7 @@
+import time
+
+from watchdog.events import FileModifiedEvent
+
 from r3build.cli import R3build
 
 
@@ -14,3 +18,110 @@ def test_load_jobs():
     assert r3.get_job('foo') is not None
     assert r3.get_job('foo').name == 'foo'
     assert r3.get_job('foo').processor.id == 'internaltest'
+
+
+def test_parallel_jobs():
+    d = {
+        'log': {'job_output': False},
+        'event': {'concurrency': 2},
+        'job': [
+            {'name': 'slow1', 'type': 'command', 'command': 'sleep 0.5'},
+            {'name': 'slow2', 'type': 'command', 'command': 'sleep 0.5'},
+        ],
+    }
+    r3 = R3build(config_dict=d)
+    for job in r3.config.job:
+        job.executor = r3.executor
+
+    start = time.monotonic()
+    for job in r3.config.job:
+        assert job.trigger(FileModifiedEvent('/tmp/foo'))
+    elapsed = time.monotonic() - start
+    assert elapsed < 0.3  # the caller never blocks on the processor
+
+    r3.close()
+    assert time.monotonic() - start < 0.9
+
+
+def test_restart_on_busy(tmp_path):
+    d = {
+        'log': {'job_output': False},
+        'job': [
+            {
+                'name': 'slow',
+                'type': 'command',
+                'command': f'echo $R3_FILENAME >> {tmp_path / "log"}; sleep 1',
+                'on_busy': 'restart',
+            },
+        ],
+    }
+    r3 = R3build(config_dict=d)
+    job = r3.get_job('slow')
+    job.executor = r3.executor
+
+    start = time.monotonic()
+    assert job.trigger(FileModifiedEvent('/tmp/first'))
+    time.sleep(0.3)
+    assert job.trigger(FileModifiedEvent('/tmp/second'))
+    assert job.trigger(FileModifiedEvent('/tmp/third'))
+    r3.executor.shutdown(wait=True)
+
+    # The first run was killed and the latest event was run again
+    assert time.monotonic() - start < 1.9
+    log = (tmp_path / 'log').read_text().split()
+    assert log[0] == '/tmp/first'
+    assert log[-1] == '/tmp/third'
+
+
+def test_restart_queued_run(tmp_path):
+    d = {
+        'log': {'job_output': False},
+        'event': {'concurrency': 1},
+        'job': [
+            {'name': 'blocker', 'type': 'command', 'command': 'sleep 0.5'},
+            {
+                'name': 'slow',
+                'type': 'command',
+                'command': f'echo $R3_FILENAME >> {tmp_path / "log"}',
+                'on_busy': 'restart',
+            },
+        ],
+    }
+    r3 = R3build(config_dict=d)
+    for job in r3.config.job:
+        job.executor = r3.executor
+
+    assert r3.get_job('blocker').trigger(FileModifiedEvent('/tmp/blocker'))
+    # The stale run is superseded while it waits for the worker
+    assert r3.get_job('slow').trigger(FileModifiedEvent('/tmp/stale'))
+    assert r3.get_job('slow').trigger(FileModifiedEvent('/tmp/fresh'))
+    time.sleep(1)
+    r3.executor.shutdown(wait=True)
+
+    assert (tmp_path / 'log').read_text().split() == ['/tmp/fresh']
+
+
+def test_batch_delivery(tmp_path):
+    d = {
+        'log': {'job_output': False},
+        'job': [
+            {
+                'name': 'batch',
+                'type': 'command',
+                'command': f'echo $R3_EVENT_COUNT >> {tmp_path / "log"}; '
+                f'cat $R3_CHANGED_FILES >> {tmp_path / "log"}',
+                'settle': 0.2,
+            },
+        ],
+    }
+    r3 = R3build(config_dict=d)
+    job = r3.get_job('batch')
+    job.executor = r3.executor
+
+    for name in ['a', 'b', 'a', 'c']:
+        assert job.trigger(FileModifiedEvent(f'/tmp/{name}'))
+    time.sleep(0.5)
+    r3.executor.shutdown(wait=True)
+
+    # Ran once with the coalesced batch
+    assert (tmp_path / 'log').read_text().split() == ['3', '/tmp/a', '/tmp/b', '/tmp/c']
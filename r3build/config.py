@@ -1,16 +1,21 @@
 from __future__ import annotations
 
-import re
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
-from fnmatch import fnmatchcase
-from functools import lru_cache
 from math import floor
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Set, Union
+
+from watchdog.events import FileSystemEvent
 
 from r3build.config_class import Log, Event, Processor, processors
 from r3build.config_validator import AccessValidator
-from r3build.processor import Processor as ProcessorParent, available_processors
+from r3build.fingerprint import FingerprintCache
+from r3build.matcher import Matcher
+from r3build.processor import Cancelled, Processor as ProcessorParent, available_processors
 from r3build.prompter import Prompter
 
 
@@ -19,6 +24,22 @@ class Job:
     _root_config: Config
     _job_config: Processor
     _prompter: Prompter
+    _matcher: Matcher
+    _fingerprints: Optional[FingerprintCache]
+
+    executor: Optional[Executor]  # runs the job synchronously if it's None
+
+    _lock: threading.Lock
+    _running: int
+    _loop: Optional[asyncio.AbstractEventLoop]  # set if the job runs on asyncio
+    _semaphore: Optional[asyncio.Semaphore]
+    _tasks: Set[asyncio.Task]
+    _superseded: Set[asyncio.Task]
+
+    _collected: List[FileSystemEvent]  # events in the settle window
+    _settle_timer: Union[threading.Timer, asyncio.TimerHandle, None]
+    _pending: List[FileSystemEvent]  # events for the trailing run
+    _last_finished: float
 
     def __init__(self, root_config: Config, prompter: Prompter, job_config: Processor):
         pid = job_config.type
@@ -30,6 +51,27 @@ class Job:
         self._root_config = root_config
         self._job_config = job_config
         self._prompter = prompter
+        self._matcher = Matcher(
+            self.glob, self.glob_exclude, self.regex, self.regex_exclude, self.when
+        )
+        self._fingerprints = None
+        if self._job_config.skip_unchanged_content:
+            self._fingerprints = FingerprintCache()
+
+        if self.on_busy not in ('drop', 'queue', 'restart'):
+            raise ValueError(f'Unknown on_busy policy: "{self.on_busy}"')
+
+        self.executor = None
+        self._lock = threading.Lock()
+        self._running = 0
+        self._loop = None
+        self._semaphore = None
+        self._tasks = set()
+        self._superseded = set()
+        self._collected = []
+        self._settle_timer = None
+        self._pending = []
+        self._last_finished = 0.0
 
     """Common job properties"""
 
@@ -84,30 +126,229 @@ class Job:
     def regex_exclude(self):
         return self._job_config.regex_exclude
 
-    def trigger(self, event):
-        if self.glob and not self._filter_glob(self.glob, event):
-            self._log_ignored_event(event)
-            return False
-        elif self.glob_exclude and self._filter_glob(self.glob_exclude, event):
-            self._log_ignored_event(event)
+    @property
+    def max_concurrency(self):
+        return self._job_config.max_concurrency
+
+    @property
+    def on_busy(self):
+        if self._job_config.on_busy:
+            return self._job_config.on_busy
+        return 'drop' if self._root_config.event.ignore_events_while_run else 'queue'
+
+    @property
+    def matcher(self) -> Matcher:
+        return self._matcher
+
+    @property
+    def settle(self):
+        return self._job_config.settle
+
+    @property
+    def tasks(self) -> Set[asyncio.Task]:
+        """Running tasks of the job on the event loop."""
+        return set(self._tasks)
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+        """Run the job on the asyncio event loop instead of the executor.
+
+        `semaphore` bounds the number of runs across all jobs.
+        """
+        self._loop = loop
+        self._semaphore = semaphore
+
+    def match(self, event, abspath=None):
+        """Returns True if the event passes the filters of the job."""
+        inputs = self._processor.inputs
+        if inputs is not None and not self._is_input(event, abspath, inputs):
+            if self._root_config.log.ignored_events:
+                self._prompter.ignore(self.name, "not an input", event)
             return False
-        elif self.regex and not self._filter_regex(self.regex, event):
+
+        if not self._matcher.match(event, abspath):
             self._log_ignored_event(event)
             return False
-        elif self.regex_exclude and self._filter_regex(self.regex_exclude, event):
-            self._log_ignored_event(event)
+
+        if (
+            self._fingerprints is not None
+            and not event.is_directory
+            and event.event_type not in ('deleted', 'moved')
+            and not self._fingerprints.changed(event.src_path)
+        ):
+            if self._root_config.log.ignored_events:
+                fp = self._fingerprints
+                reason = f"unchanged content, cache hits: {fp.hits}, misses: {fp.misses}"
+                self._prompter.ignore(self.name, reason, event)
             return False
-        elif self.when and not self._filter_when(self.when, event):
-            self._log_ignored_event(event)
+
+        return True
+
+    @staticmethod
+    def _is_input(event, abspath, inputs):
+        if abspath is None:
+            abspath = Matcher.normalize(event.src_path)
+        if abspath in inputs:
+            return True
+        # Editors save files by moving a temporary file onto them
+        return event.event_type == 'moved' and Matcher.normalize(event.dest_path) in inputs
+
+    def trigger(self, event, abspath=None, timestamp=None, defer=False):
+        """Filter the event and collect it if it matches.
+
+        Collected events are launched together as a batch when the settle
+        window of the job expires. If the job doesn't have a settle window,
+        they are launched right away, or by flush() if `defer` is set.
+
+        The processor runs on the event loop if it's bound, or on the executor
+        if it's set. Returns True if the event was accepted by the job.
+        """
+        if not self.match(event, abspath):
             return False
 
-        if self._root_config.log.launched_events:
-            self._prompter.trigger(self.name, event)
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with self._lock:
+            if self.on_busy == 'drop' and (self._busy() or timestamp < self._last_finished):
+                if self._root_config.log.ignored_events:
+                    self._prompter.ignore(self.name, "overlapped", event)
+                return False
 
+            self._collected.append(event)
+            if self.settle > 0:
+                if self._settle_timer is None:
+                    self._settle_timer = self._call_later(self.settle, self.flush, True)
+                return True
+
+        if not defer:
+            self.flush()
+        return True
+
+    def flush(self, settled=False):
+        """Launch the collected events as a batch.
+
+        It does nothing while the settle window is open unless `settled` is set.
+        """
+        with self._lock:
+            if self._settle_timer is not None:
+                if not settled:
+                    return
+                self._settle_timer = None
+
+            events, self._collected = self._collected, []
+            if not events:
+                return
+
+            if self._busy():
+                if self.on_busy == 'drop':
+                    if self._root_config.log.ignored_events:
+                        for event in events:
+                            self._prompter.ignore(self.name, "overlapped", event)
+                    return
+
+                # Coalesce into one trailing run
+                self._pending = self._coalesce(self._pending + events)
+                if self.on_busy == 'restart':
+                    self._supersede()
+                return
+            self._running += 1
+            # Taken now, so a supersede while the run waits in the executor cancels it
+            generation = self._processor._generation
+
+        if self._loop is not None:
+            task = self._loop.create_task(self._run_loop_async(events))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif self.executor is not None:
+            self.executor.submit(self._run_loop, events, generation)
+        else:
+            self._run_loop(events, generation)
+
+    def _call_later(self, delay, fn, *args):
+        if self._loop is not None:
+            return self._loop.call_later(delay, fn, *args)
+        timer = threading.Timer(delay, fn, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _supersede(self):
+        if self._loop is None:
+            self._processor.cancel()
+            return
+        for task in self._tasks:
+            self._superseded.add(task)
+            task.cancel()
+
+    def _busy(self):
+        return self._running >= max(self.max_concurrency, 1)
+
+    def _next_batch(self):
+        # Called after a run; returns the trailing batch (or None if there's nothing to run)
+        # and the generation of the processor it begins with
+        with self._lock:
+            self._last_finished = time.monotonic()
+            if not self._pending:
+                self._running -= 1
+                return None, None
+            events, self._pending = self._pending, []
+            return events, self._processor._generation
+
+    def _run_loop(self, events, generation):
+        events = self._coalesce(events)
+        while events:
+            try:
+                self._run(events, generation)
+            except Cancelled:
+                self._prompter.result(self.name, 'SUPERSEDED', 'yellow')
+            except Exception as e:
+                self._prompter.procerr(self.name, f'Error: {e!r}')
+            events, generation = self._next_batch()
+
+    async def _run_loop_async(self, events):
+        events = self._coalesce(events)
+        task = asyncio.current_task()
+        while events:
+            try:
+                async with self._semaphore:
+                    await self._run_async(events)
+            except asyncio.CancelledError:
+                if task not in self._superseded:
+                    with self._lock:
+                        self._running -= 1
+                    raise
+                self._superseded.discard(task)
+                if hasattr(task, 'uncancel'):
+                    task.uncancel()
+                self._prompter.result(self.name, 'SUPERSEDED', 'yellow')
+            except Exception as e:
+                self._prompter.procerr(self.name, f'Error: {e!r}')
+            events, _ = self._next_batch()
+
+    def _run(self, events, generation):
+        self.processor.begin(generation)
+        if generation != self.processor._generation:
+            # Superseded while it was waiting for a worker
+            raise Cancelled
+        self._log_launched_events(events)
         start = datetime.now()
-        result = self.processor.on_change(event)
-        diff = datetime.now() - start
+        result = self.processor.on_change_batch(events)
+        self._report(result, datetime.now() - start)
 
+    async def _run_async(self, events):
+        self._log_launched_events(events)
+        start = datetime.now()
+        result = await self.processor.on_change_batch_async(events)
+        self._report(result, datetime.now() - start)
+
+    def _log_launched_events(self, events):
+        if self._root_config.log.launched_events:
+            if len(events) == 1:
+                self._prompter.trigger(self.name, events[0])
+            else:
+                self._prompter.trigger_batch(self.name, events)
+
+    def _report(self, result, diff):
         info = []
 
         if result.message:
@@ -134,37 +375,16 @@ class Job:
                 color = "green" if result.success else "red"
             self._prompter.result(self.name, info, color)
 
-        return True
-
     """Utilities"""
 
-    def _filter_glob(self, pattern, event):
-        if isinstance(pattern, list):
-            abspath = str(Path(event.src_path).absolute())
-            return any(fnmatchcase(abspath, str(Path(p).absolute())) for p in pattern)
-        abspath = str(Path(event.src_path).absolute())
-        return fnmatchcase(abspath, str(Path(pattern).absolute()))
-
-    def _filter_regex(self, pattern, event):
-        if isinstance(pattern, list):
-            match = [self._re_match(p) for p in pattern]
-        else:
-            match = [self._re_match(pattern)]
-        return any(m(event.src_path) is not None for m in match)
-
-    def _filter_when(self, when, event):
-        if isinstance(when, list):
-            return any(o == event.event_type for o in when)
-        return when == event.event_type
-
     def _log_ignored_event(self, event):
         if self._root_config.log.ignored_events:
             self._prompter.ignore(self.name, "patterns don't match", event)
 
     @staticmethod
-    @lru_cache(typed=True)
-    def _re_match(pattern):
-        return re.compile(pattern).search
+    def _coalesce(events):
+        # Remove duplicates by (src_path, event_type), keeping the order and the latest event
+        return list({(e.src_path, e.event_type): e for e in events}.values())
 
 
 class Config(AccessValidator):
@@ -191,6 +411,7 @@ class Config(AccessValidator):
             self.log.accepted_events = True
             self.log.ignored_events = True
             self.log.launched_events = True
+            self.log.jobserver = True
 
         self.event = Event('event', raw_dict.get('event', dict()))
 
@@ -10,6 +10,7 @@ class Log(AccessValidator):
         "all",
         "ignored_events",
         "job_output",
+        "jobserver",
         "launched_events",
         "result",
         "time",
@@ -22,23 +23,41 @@ class Log(AccessValidator):
     job_output: bool = True
     result: bool = True
     time: bool = True
+    jobserver: bool = False
 
 
 class Event(AccessValidator):
-    _slots = {"ignore_events_while_run", "rate_limit_duration"}
+    _slots = {
+        "concurrency",
+        "ignore_events_while_run",
+        "jobserver",
+        "jobserver_slots",
+        "rate_limit_duration",
+        "snapshot",
+        "snapshot_hash",
+    }
     _required = set()
     rate_limit_duration: float = 0.01
     ignore_events_while_run: bool = True
+    concurrency: int = 0
+    snapshot: str = ""
+    snapshot_hash: bool = False
+    jobserver: bool = False
+    jobserver_slots: int = 0
 
 
 class Processor(AccessValidator):
     _slots = {
         "glob",
         "glob_exclude",
+        "max_concurrency",
         "name",
+        "on_busy",
         "path",
         "regex",
         "regex_exclude",
+        "settle",
+        "skip_unchanged_content",
         "type",
         "when",
     }
@@ -51,41 +70,104 @@ class Processor(AccessValidator):
     glob_exclude: Union[List[str], str] = ""
     regex: Union[List[str], str] = ""
     regex_exclude: Union[List[str], str] = ""
+    max_concurrency: int = 1
+    on_busy: str = ""
+    settle: float = 0.0
+    skip_unchanged_content: bool = False
 
 
 class MakeProcessorConfig(Processor):
-    _slots = Processor._slots.union({"directory", "environment", "jobs", "target"})
+    _slots = Processor._slots.union(
+        {"depfiles", "directory", "environment", "infer_targets", "jobs", "target"}
+    )
     _required = Processor._required.union(set())
     target: str = ""
     environment: Dict[str, str] = ""
     jobs: int = 0
     directory: str = ""
+    infer_targets: bool = False
+    depfiles: Union[List[str], str] = ""
 
 
 class CommandProcessorConfig(Processor):
-    _slots = Processor._slots.union({"command", "environment"})
+    _slots = Processor._slots.union(
+        {"command", "environment", "files_chunk_size", "files_parallel"}
+    )
     _required = Processor._required.union({"command"})
     command: str = ""
+    files_chunk_size: int = 0
+    files_parallel: int = 1
     environment: Dict[str, str] = ""
 
 
 class DaemonProcessorConfig(Processor):
     _slots = Processor._slots.union(
-        {"command", "environment", "signal", "stderr", "stdout", "timeout"}
+        {
+            "command",
+            "environment",
+            "preload",
+            "python_entry",
+            "ready_file",
+            "ready_pattern",
+            "ready_port",
+            "ready_timeout",
+            "replicas",
+            "restart_delay",
+            "restart_delay_max",
+            "restart_policy",
+            "restart_strategy",
+            "rolling_batch",
+            "signal",
+            "stderr",
+            "stdout",
+            "timeout",
+        }
     )
-    _required = Processor._required.union({"command"})
+    _required = Processor._required.union(set())
     command: str = ""
+    python_entry: str = ""
+    preload: List[str] = []
     signal: Union[int, str] = "SIGINT"
     timeout: int = 10
     stdout: bool = True
     stderr: bool = True
+    restart_strategy: str = "stop-first"
+    ready_port: int = 0
+    ready_pattern: str = ""
+    ready_file: str = ""
+    ready_timeout: float = 30.0
+    restart_policy: str = "no"
+    restart_delay: float = 1.0
+    restart_delay_max: float = 60.0
+    replicas: int = 1
+    rolling_batch: int = 1
     environment: Dict[str, str] = ""
 
 
 class PytestProcessorConfig(Processor):
-    _slots = Processor._slots.union({"target"})
+    _slots = Processor._slots.union({"forkserver", "impact", "preload", "target", "workers"})
     _required = Processor._required.union({"target"})
     target: str = ""
+    forkserver: bool = False
+    preload: List[str] = []
+    impact: bool = False
+    workers: int = 1
+
+
+class PythonProcessorConfig(Processor):
+    _slots = Processor._slots.union({"batch", "function", "pool", "workers"})
+    _required = Processor._required.union({"function"})
+    function: str = ""
+    batch: bool = False
+    pool: str = ""
+    workers: int = 0
+
+
+class SyncProcessorConfig(Processor):
+    _slots = Processor._slots.union({"delete", "destination"})
+    _required = Processor._required.union({"destination"})
+    destination: str = ""
+    delete: bool = True
 
 
 class InternaltestProcessorConfig(Processor):
@@ -98,5 +180,7 @@ processors = {
     "command": CommandProcessorConfig,
     "daemon": DaemonProcessorConfig,
     "pytest": PytestProcessorConfig,
+    "python": PythonProcessorConfig,
+    "sync": SyncProcessorConfig,
     "internaltest": InternaltestProcessorConfig,
 }
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from subprocess import Popen
+from typing import List, Optional, Pattern, Set, Union
+
+from r3build.forkserver import ForkedProcess
+
+_TCP_LISTEN = '0A'  # state of listening sockets in /proc/net/tcp
+
+
+class DaemonInstance:
+    """A daemon process that leads its own process group.
+
+    `proc` is a Popen or a ForkedProcess of a fork server. If `pattern` is
+    given, stdout of the Popen is read through a pipe by a thread that echoes
+    it (if `echo` is set) and flags the first matching line.
+    """
+
+    proc: Union[Popen, ForkedProcess]
+    matched: threading.Event  # set when a line of stdout matched `pattern`
+    exited: threading.Event  # set when the process has exited
+    stopping: bool  # set by stop_all(), so the exit is not a crash
+    started_at: float
+    exited_at: Optional[float]
+
+    def __init__(self, proc, pattern=None, echo=True, on_exit=None):
+        self.proc = proc
+        self.matched = threading.Event()
+        self.exited = threading.Event()
+        self.stopping = False
+        self.started_at = time.monotonic()
+        self.exited_at = None
+        self._waiters = []  # futures of wait_async() and their loops
+        self._waiters_lock = threading.Lock()
+
+        # The thread sleeps in waitpid() until SIGCHLD, so the exit is noticed as soon as it happens
+        threading.Thread(target=self._wait, args=(on_exit,), daemon=True).start()
+        if pattern is not None:
+            threading.Thread(target=self._pump, args=(pattern, echo), daemon=True).start()
+
+    @classmethod
+    def popen(cls, command, env=None, stdout=True, stderr=True, pattern=None, on_exit=None):
+        """Run the shell command in a new process group."""
+        if pattern is not None:
+            out = subprocess.PIPE
+        else:
+            out = None if stdout else subprocess.DEVNULL
+        err = None if stderr else subprocess.DEVNULL
+        proc = Popen(command, shell=True, stdout=out, stderr=err, env=env, start_new_session=True)
+        return cls(proc, pattern, stdout, on_exit)
+
+    @property
+    def pid(self):
+        return self.proc.pid
+
+    @property
+    def uptime(self) -> float:
+        end = self.exited_at if self.exited_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def poll(self):
+        return self.proc.poll()
+
+    def signal(self, sig):
+        try:
+            os.killpg(self.proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def wait_async(self, timeout=None) -> bool:
+        """Await the exit without holding a thread. Returns False if it times out."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._waiters_lock:
+            if self.exited.is_set():
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _wait(self, on_exit):
+        self.proc.wait()
+        self.exited_at = time.monotonic()
+        with self._waiters_lock:
+            self.exited.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # The loop has been closed
+                pass
+        if on_exit is not None:
+            on_exit(self)
+
+    def _pump(self, pattern: Pattern, echo):
+        for line in self.proc.stdout:
+            if echo:
+                sys.stdout.buffer.write(line)
+                sys.stdout.flush()
+            if not self.matched.is_set() and pattern.search(line.decode(errors='replace')):
+                self.matched.set()
+        self.proc.stdout.close()
+
+
+def stop_all(instances: List[DaemonInstance], sig, timeout):
+    """Send the signal to the process groups once and wait for their exits.
+
+    The groups that don't exit in `timeout` seconds are killed by SIGKILL.
+    """
+    deadline = time.monotonic() + timeout
+    for instance in instances:
+        instance.stopping = True
+        instance.signal(sig)
+    for instance in instances:
+        if not instance.exited.wait(max(deadline - time.monotonic(), 0)):
+            instance.signal(signal.SIGKILL)
+            instance.exited.wait()
+
+
+async def stop_all_async(instances: List[DaemonInstance], sig, timeout):
+    """stop_all for the asyncio engine. It awaits the exits instead of blocking a thread."""
+    deadline = time.monotonic() + timeout
+    for instance in instances:
+        instance.stopping = True
+        instance.signal(sig)
+    for instance in instances:
+        if not await instance.wait_async(max(deadline - time.monotonic(), 0)):
+            instance.signal(signal.SIGKILL)
+            await instance.wait_async()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ReadinessProbe:
+    """Tells when a started daemon is ready to serve.
+
+    It's ready when all of the configured checks pass: a process in the
+    group of the instance listens on the TCP `port`, a line of stdout
+    matches `pattern`, and `file` exists. It's always ready if nothing is
+    configured.
+
+    The port is checked in /proc instead of connecting to it, as the old
+    process may still be listening on it with SO_REUSEPORT.
+    """
+
+    port: int
+    pattern: Optional[Pattern]
+    file: str
+    timeout: float
+    interval: float = 0.05
+
+    def __init__(self, port=0, pattern='', file='', timeout=30.0):
+        self.port = port
+        self.pattern = re.compile(pattern) if pattern else None
+        self.file = file
+        self.timeout = timeout
+
+    @property
+    def enabled(self):
+        return bool(self.port or self.pattern or self.file)
+
+    def prepare(self):
+        """Remove the file left by the previous process before starting a new one."""
+        if self.file:
+            try:
+                os.unlink(self.file)
+            except FileNotFoundError:
+                pass
+
+    def wait(self, instance: DaemonInstance) -> bool:
+        """Wait until the instance gets ready. Returns False if it exits or times out."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if instance.poll() is not None:
+                return False
+            if self._ready(instance):
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self.pattern and not instance.matched.is_set():
+                instance.matched.wait(min(remaining, self.interval))
+            else:
+                time.sleep(min(remaining, self.interval))
+
+    async def wait_async(self, instance: DaemonInstance) -> bool:
+        """wait for the asyncio engine. It polls the checks without blocking a thread."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if instance.poll() is not None:
+                return False
+            if await self._ready_async(instance):
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(remaining, self.interval))
+
+    def _ready(self, instance):
+        if self.pattern and not instance.matched.is_set():
+            return False
+        if self.file and not os.path.exists(self.file):
+            return False
+        if self.port and not self._listening(instance):
+            return False
+        return True
+
+    async def _ready_async(self, instance):
+        if self.pattern and not instance.matched.is_set():
+            return False
+        if self.file and not os.path.exists(self.file):
+            return False
+        if self.port and not self._listening(instance):
+            return False
+        return True
+
+    def _listening(self, instance: DaemonInstance) -> bool:
+        # Sockets listening on the port, by inode
+        listening = set()
+        for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+            try:
+                with open(table) as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        port = int(fields[1].rsplit(':', 1)[1], 16)
+                        if fields[3] == _TCP_LISTEN and port == self.port:
+                            listening.add(fields[9])
+            except OSError:
+                continue
+        if not listening:
+            return False
+        return not listening.isdisjoint(_group_sockets(instance.pid))
+
+
+def _group_sockets(pgid) -> Set[str]:
+    """Inodes of the sockets opened by the processes in the process group."""
+    inodes = set()
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # The command name in parentheses may contain spaces
+                stat = f.read().rsplit(')', 1)[1].split()
+            if int(stat[2]) != pgid:
+                continue
+            fds = os.listdir(f'/proc/{pid}/fd')
+        except (OSError, IndexError, ValueError):
+            # Exited, or not ours to read
+            continue
+        for fd in fds:
+            try:
+                link = os.readlink(f'/proc/{pid}/fd/{fd}')
+            except OSError:
+                continue
+            if link.startswith('socket:['):
+                inodes.add(link[8:-1])
+    return inodes
@@ -0,0 +1,291 @@
+import asyncio
+import os
+import re
+import socket
+import time
+
+import pytest
+from watchdog.events import FileModifiedEvent
+
+from r3build.cli import R3build
+
+
+def daemon(tmp_path, **kwargs):
+    job = {'name': 'daemon', 'type': 'daemon', 'path': str(tmp_path), 'signal': 'SIGTERM'}
+    job.update(kwargs)
+    r3 = R3build(config_dict={'job': [job]})
+    return r3.get_job('daemon').processor
+
+
+def test_start_first(tmp_path):
+    script = "import time; time.sleep(0.2); print('serving', flush=True); time.sleep(100)"
+    processor = daemon(
+        tmp_path,
+        command=f'python3 -c "{script}"',
+        restart_strategy='start-first',
+        ready_pattern='^serving',
+        stdout=False,
+    )
+    processor.open()
+    try:
+        old = processor._child_process
+        result = processor.on_change(FileModifiedEvent(str(tmp_path / 'app.py')))
+        assert result.success
+        assert processor._child_process is not old
+        assert processor._child_process.matched.is_set()
+        assert old.poll() is not None
+    finally:
+        processor.close()
+
+
+def test_restart_async(tmp_path):
+    # The old process ignores SIGTERM, so it's killed after the timeout
+    script = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(100)"
+    processor = daemon(
+        tmp_path,
+        command=f'exec python3 -c "{script}"',
+        restart_strategy='start-first',
+        timeout=1,
+    )
+
+    async def _main():
+        await processor.open_async()
+        try:
+            old = processor._child_process
+            await asyncio.sleep(0.3)
+            result = await processor.on_change_batch_async([FileModifiedEvent('app.py')])
+            assert result.success
+            assert processor._child_process is not old
+            assert old.exited.is_set() and old.poll() == -9
+            assert processor.crashes == 0
+        finally:
+            await processor.close_async()
+        assert processor._child_process is None
+
+    asyncio.run(_main())
+
+
+def test_ready_port_late_bind(tmp_path):
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    # The new process binds the port 1 second after starting, while the old one still listens
+    (tmp_path / 'server.py').write_text(
+        'import socket, sys, time\n'
+        'time.sleep(float(sys.argv[1]))\n'
+        's = socket.socket()\n'
+        's.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)\n'
+        f's.bind(("localhost", {port}))\n'
+        's.listen()\n'
+        'time.sleep(100)\n'
+    )
+    processor = daemon(
+        tmp_path,
+        command=f'exec python3 {tmp_path / "server.py"} 0',
+        restart_strategy='start-first',
+        ready_port=port,
+        ready_timeout=10.0,
+    )
+    processor.open()
+    try:
+        assert processor._probe.wait(processor._child_process)
+        processor._config.command = f'exec python3 {tmp_path / "server.py"} 1'
+        started = time.monotonic()
+        assert processor.on_change(FileModifiedEvent(str(tmp_path / 'app.py'))).success
+        assert time.monotonic() - started >= 0.9
+        socket.create_connection(('localhost', port), 1).close()
+    finally:
+        processor.close()
+
+
+def test_not_ready(tmp_path):
+    ready = tmp_path / 'ready'
+    processor = daemon(
+        tmp_path,
+        command=f'touch {ready}; sleep 100',
+        restart_strategy='start-first',
+        ready_file=str(ready),
+        ready_timeout=0.5,
+    )
+    processor.open()
+    try:
+        assert processor._probe.wait(processor._child_process)
+        assert processor.on_change(FileModifiedEvent(str(tmp_path / 'app.py'))).success
+
+        # The new process never gets ready; the old one is kept
+        processor._config.command = 'sleep 100'
+        old = processor._child_process
+        result = processor.on_change(FileModifiedEvent(str(tmp_path / 'app.py')))
+        assert not result.success
+        assert processor._child_process is old
+        assert old.poll() is None
+    finally:
+        processor.close()
+
+
+def test_restart_durations(tmp_path):
+    processor = daemon(tmp_path, command='sleep 100', timeout=10)
+    processor.open()
+    try:
+        old = processor._child_process
+        result = processor.on_change(FileModifiedEvent(str(tmp_path / 'app.py')))
+        assert re.fullmatch(r'Restarted! \(stop: \d+ms, start: \d+ms\)', result.message)
+        assert old.exited.is_set()
+    finally:
+        processor.close()
+
+
+def test_supervision(tmp_path):
+    processor = daemon(
+        tmp_path,
+        command='sleep 0.1; exit 3',
+        restart_policy='on-failure',
+        restart_delay=0.1,
+        restart_delay_max=0.5,
+    )
+    processor.open()
+    try:
+        deadline = time.monotonic() + 10
+        while processor.restarts < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert processor.restarts >= 2
+        assert processor.crashes >= 2
+    finally:
+        processor.close()
+
+    restarts = processor.restarts
+    time.sleep(1)
+    assert processor.restarts == restarts
+
+
+def test_supervision_realtime_signal(tmp_path):
+    # Real-time signals don't have names in signal.Signals
+    script = 'import os, signal, time; time.sleep(0.1); os.kill(os.getpid(), signal.SIGRTMIN + 1)'
+    processor = daemon(
+        tmp_path, command=f'exec python3 -c "{script}"', restart_policy='always', restart_delay=0.1
+    )
+    processor.open()
+    try:
+        deadline = time.monotonic() + 10
+        while processor.restarts < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert processor.restarts >= 1
+    finally:
+        processor.close()
+
+
+def test_no_restart(tmp_path):
+    processor = daemon(tmp_path, command='exit 0', restart_policy='on-failure', restart_delay=0.1)
+    processor.open()
+    try:
+        processor._child_process.exited.wait(5)
+        time.sleep(0.3)
+        assert processor.crashes == 1
+        assert processor.restarts == 0
+    finally:
+        processor.close()
+
+
+def test_python_entry(tmp_path, monkeypatch):
+    project = tmp_path / 'project'
+    (project / 'svc').mkdir(parents=True)
+    (project / 'svc' / '__init__.py').write_text('')
+    (project / 'svc' / 'main.py').write_text(
+        'import os, sys, time\n'
+        'def main():\n'
+        '    assert "stable" in sys.modules\n'
+        f'    open({str(tmp_path / "pid")!r}, "w").write(str(os.getpid()))\n'
+        '    time.sleep(100)\n'
+    )
+    libs = tmp_path / 'libs'
+    libs.mkdir()
+    (libs / 'stable.py').write_text('VALUE = 1\n')
+    monkeypatch.syspath_prepend(str(project))
+    monkeypatch.syspath_prepend(str(libs))
+
+    processor = daemon(project, python_entry='svc.main:main', preload=['stable'])
+    processor.open()
+    try:
+        template = processor._server.pid
+        assert any(f.endswith('stable.py') for f in processor._stamps)
+        assert not any(f.startswith(str(project)) for f in processor._stamps)
+        assert processor.on_change(FileModifiedEvent(str(project / 'svc' / 'main.py'))).success
+        assert processor._server.pid == template
+
+        # A change of a preloaded file outside the project rebuilds the template
+        pid = tmp_path / 'pid'
+        pid.unlink(missing_ok=True)
+        os.utime(libs / 'stable.py', ns=(0, 0))
+        assert processor.on_change(FileModifiedEvent(str(project / 'svc' / 'main.py'))).success
+        assert processor._server.pid != template
+
+        deadline = time.monotonic() + 10
+        while not (pid.exists() and pid.read_text()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert int(pid.read_text()) == processor._child_process.pid
+    finally:
+        processor.close()
+
+
+def test_template_rebuild_start_first(tmp_path, monkeypatch):
+    project = tmp_path / 'project'
+    project.mkdir()
+    (project / 'svc.py').write_text(
+        'import signal, time\n'
+        'def main():\n'
+        '    signal.signal(signal.SIGINT, signal.SIG_IGN)\n'
+        '    time.sleep(100)\n'
+    )
+    libs = tmp_path / 'libs'
+    libs.mkdir()
+    (libs / 'stable.py').write_text('VALUE = 1\n')
+    monkeypatch.syspath_prepend(str(project))
+    monkeypatch.syspath_prepend(str(libs))
+
+    processor = daemon(
+        project,
+        python_entry='svc:main',
+        preload=['stable'],
+        signal='SIGINT',
+        timeout=1,
+        restart_strategy='start-first',
+    )
+    processor.open()
+    try:
+        old, template = processor._child_process, processor._server.pid
+        os.utime(libs / 'stable.py', ns=(0, 0))
+        # The old template keeps reporting the old process until it's killed
+        result = processor.on_change(FileModifiedEvent(str(project / 'svc.py')))
+        assert result.success
+        assert processor._server.pid != template
+        assert old.poll() == -9
+        assert processor.crashes == 0
+    finally:
+        processor.close()
+    with pytest.raises(ProcessLookupError):
+        os.kill(old.pid, 0)
+
+
+def test_replicas(tmp_path):
+    processor = daemon(
+        tmp_path,
+        command=f'echo $$ > {tmp_path}/replica-$R3_REPLICA_INDEX; exec sleep 100',
+        replicas=3,
+        rolling_batch=2,
+        restart_strategy='start-first',
+    )
+    processor.open()
+    try:
+        old = list(processor._replicas)
+        assert processor.on_change(FileModifiedEvent(str(tmp_path / 'app.py'))).success
+        assert processor.restarts == 3
+        assert all(r.exited.is_set() for r in old)
+        assert all(r.poll() is None for r in processor._replicas)
+
+        deadline = time.monotonic() + 10
+        files = [tmp_path / f'replica-{i}' for i in range(3)]
+        while not all(f.exists() and f.read_text() for f in files) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert {int(f.read_text()) for f in files} <= {r.pid for r in old + processor._replicas}
+    finally:
+        processor.close()
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import glob
+import os
+import re
+from typing import Iterable, List, Set
+
+_colon = re.compile(r'(?<!\\):(?=\s|$)')
+_word = re.compile(r'(?:\\[ #]|\S)+')
+
+
+def parse(text) -> List[str]:
+    """Returns the prerequisites in the rules of a depfile made by `gcc -MD`.
+
+    Targets are left out. Spaces and "#" in names are escaped by backslashes,
+    and "$" is doubled, as gcc writes them.
+    """
+    prereqs = []
+    for line in text.replace('\\\n', ' ').splitlines():
+        parts = _colon.split(line, 1)
+        if len(parts) < 2:
+            continue
+        for word in _word.findall(parts[1]):
+            prereqs.append(re.sub(r'\\([ #])', r'\1', word).replace('$$', '$'))
+    return prereqs
+
+
+def read_inputs(patterns: Iterable[str], directory) -> Set[str]:
+    """Read the depfiles that match the glob patterns, and returns the absolute paths they list.
+
+    Relative patterns and paths are resolved from `directory`.
+    Depfiles that can't be read are skipped.
+    """
+    inputs = set()
+    for pattern in patterns:
+        for path in glob.iglob(os.path.join(directory, pattern), recursive=True):
+            try:
+                with open(path, errors='replace') as f:
+                    text = f.read()
+            except OSError:
+                continue
+            inputs.update(os.path.normpath(os.path.join(directory, p)) for p in parse(text))
+    return inputs
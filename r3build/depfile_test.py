@@ -0,0 +1,53 @@
+from watchdog.events import FileModifiedEvent, FileMovedEvent
+
+from r3build.cli import R3build
+from r3build.depfile import parse
+
+
+def test_parse():
+    text = (
+        'build/main.o: src/main.c include/a\\ b.h \\\n'
+        ' include/c\\#.h lib$$.h\n'
+        'include/a\\ b.h:\n'
+    )
+    assert parse(text) == ['src/main.c', 'include/a b.h', 'include/c#.h', 'lib$.h']
+
+
+MAKEFILE = '''all: main.o
+
+%.o: %.c
+\tcat $< > $@
+\tprintf '%s: %s common.h\\n' $@ $< > $*.d
+'''
+
+
+def test_make_depfiles(tmp_path):
+    (tmp_path / 'Makefile').write_text(MAKEFILE)
+    for name in ['main.c', 'common.h', 'notes.txt']:
+        (tmp_path / name).write_text(name)
+
+    job = {
+        'name': 'make',
+        'type': 'make',
+        'directory': str(tmp_path),
+        'path': str(tmp_path),
+        'depfiles': '*.d',
+    }
+    r3 = R3build(config_dict={'job': [job], 'log': {'job_output': False}})
+    job = r3.get_job('make')
+    job.processor.open()
+
+    # Nothing is dropped until the depfiles are written
+    assert job.processor.inputs is None
+    assert job.match(FileModifiedEvent(str(tmp_path / 'notes.txt')))
+
+    assert job.processor.on_change(FileModifiedEvent(str(tmp_path / 'main.c'))).success
+    assert job.processor.inputs == {
+        str(tmp_path / name)
+        for name in ['main.c', 'common.h', 'GNUmakefile', 'makefile', 'Makefile']
+    }
+    for name in ['main.c', 'common.h', 'Makefile']:
+        assert job.match(FileModifiedEvent(str(tmp_path / name)))
+    for name in ['notes.txt', 'main.o', 'main.d']:
+        assert not job.match(FileModifiedEvent(str(tmp_path / name)))
+    assert job.match(FileMovedEvent(str(tmp_path / 'common.h~'), str(tmp_path / 'common.h')))
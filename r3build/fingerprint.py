@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import stat
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+
+class FingerprintCache:
+    """LRU cache of file contents' fingerprints.
+
+    It tells if the content of a file has changed since the last time it
+    was seen. Files are hashed only when their (inode, size, mtime_ns) have
+    changed; an unchanged stat is considered to be an unchanged content.
+    """
+
+    maxsize: int
+    hits: int  # lookups answered by the stat
+    misses: int  # lookups that needed hashing
+    _entries: OrderedDict[str, Tuple[Tuple[int, int, int], bytes]]
+
+    chunk_size = 1 << 20
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def changed(self, path) -> bool:
+        """Returns False if the file has the same content as the last time.
+
+        Files that are seen for the first time, can't be read or are not
+        regular files are always considered to be changed.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return True
+
+        if not stat.S_ISREG(st.st_mode):
+            return True
+
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return False
+            self.misses += 1
+
+        try:
+            digest = self._hash(path)
+        except OSError:
+            return True
+
+        with self._lock:
+            self._entries[path] = (key, digest)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return entry is None or entry[1] != digest
+
+    def _hash(self, path):
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return h.digest()
@@ -0,0 +1,37 @@
+import os
+
+from r3build.fingerprint import FingerprintCache
+
+
+def test_changed(tmp_path):
+    cache = FingerprintCache()
+    path = tmp_path / 'foo.txt'
+    path.write_text('miku')
+
+    assert cache.changed(str(path))  # seen for the first time
+    assert not cache.changed(str(path))  # same stat
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Touched: the stat changed but the content didn't
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert not cache.changed(str(path))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    path.write_text('mikumiku')
+    assert cache.changed(str(path))
+
+    path.unlink()
+    assert cache.changed(str(path))
+    assert len(cache) == 0
+
+
+def test_lru(tmp_path):
+    cache = FingerprintCache(maxsize=2)
+    for name in ['a', 'b', 'c']:
+        (tmp_path / name).write_text(name)
+        cache.changed(str(tmp_path / name))
+
+    assert len(cache) == 2
+    assert cache.changed(str(tmp_path / 'a'))  # evicted, so it's unknown again
+    assert not cache.changed(str(tmp_path / 'c'))
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import importlib
+import json
+import os
+import queue
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+
+class ForkedProcess:
+    """A handle of a process forked by ForkServer.
+
+    It has the subset of subprocess.Popen interface that r3build uses.
+    """
+
+    pid: int
+    returncode: Optional[int]
+
+    lost_code = 255  # returncode of a child that exited after its template had gone
+
+    def __init__(self, pid, args):
+        self.pid = pid
+        self.args = args
+        self.returncode = None
+        self._exited = threading.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise TimeoutError(f'Process {self.pid} did not exit in {timeout} seconds')
+        return self.returncode
+
+    def _set_exit(self, code):
+        self.returncode = code
+        self._exited.set()
+
+
+class ForkServer:
+    """A warm template process that forks children on request.
+
+    The template is a fresh interpreter started by r3build, so it doesn't
+    inherit the threads, file descriptors and signal handlers of r3build.
+    It imports the `preload` modules once
+    and forgets modules that start with one of `purge`, so the children
+    import them freshly. A child calls a function specified by an import
+    path ("module:function") and exits with its return value.
+
+    Children start without paying the import cost of the preloaded modules,
+    don't share any state with each other, and the memory of r3build stays
+    flat as they exit after a run.
+    """
+
+    preload: List[str]
+    purge: List[str]
+    pid: Optional[int]
+    preloaded_files: List[str]  # source files of modules loaded in the template
+
+    def __init__(self, preload=(), purge=()):
+        self.preload = list(preload)
+        self.purge = list(purge)
+        self.pid = None
+        self.preloaded_files = []
+        self._sock = None
+        self._proc = None
+        self._stopping = False
+        self._children: Dict[int, ForkedProcess] = dict()
+        self._replies = queue.Queue()
+        self._lock = threading.Lock()  # serializes requests
+        self._children_lock = threading.Lock()
+
+    # -- r3build side --
+
+    def start(self):
+        parent_sock, child_sock = socket.socketpair()
+        options = {
+            'fd': child_sock.fileno(),
+            'path': sys.path,
+            'preload': self.preload,
+            'purge': self.purge,
+        }
+        # Forking r3build itself isn't safe, as it has threads
+        argv = [sys.executable, '-c', _bootstrap, json.dumps(options)]
+        try:
+            self._proc = subprocess.Popen(argv, pass_fds=[child_sock.fileno()])
+        finally:
+            child_sock.close()
+        self.pid = self._proc.pid
+        self._sock = parent_sock
+        self._rfile = parent_sock.makefile('r')
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+        ready = self._replies.get()
+        if 'error' in ready:
+            raise RuntimeError(f'Failed to start the fork server: {ready["error"]}')
+        self.preloaded_files = ready['files']
+
+    def spawn(self, target, args=(), env=None, setsid=True, quiet=False) -> ForkedProcess:
+        """Fork a child from the template to call `target` ("module:function") with `args`."""
+        request = {
+            'target': target,
+            'args': list(args),
+            'env': env or dict(),
+            'cwd': os.getcwd(),
+            'setsid': setsid,
+            'quiet': quiet,
+        }
+        with self._lock:
+            if self._sock is None or self._stopping:
+                raise RuntimeError('The fork server is not running')
+            self._sock.sendall((json.dumps(request) + '\n').encode())
+            reply = self._replies.get()
+        if isinstance(reply, dict):
+            raise RuntimeError(f'Failed to fork: {reply.get("error")}')
+        reply.args = target
+        return reply
+
+    def stop(self):
+        """Stop the template once all of its children have exited.
+
+        New children can't be forked after it's called. The template keeps
+        running while any child is, so their exits are still reported.
+        """
+        with self._children_lock:
+            self._stopping = True
+            if self._children:
+                return
+        self._close()
+
+    def _close(self):
+        with self._lock:
+            if self._sock is None:
+                return
+            self._sock.shutdown(socket.SHUT_RDWR)
+            self._sock.close()
+            self._sock = None
+        self._proc.wait()
+        self.pid = None
+
+    def _read_loop(self):
+        for line in self._rfile:
+            message = json.loads(line)
+            if 'exit' in message:
+                with self._children_lock:
+                    child = self._children.pop(message['exit'], None)
+                    retire = self._stopping and not self._children
+                if child is not None:
+                    child._set_exit(message['code'])
+                if retire:
+                    # stop() has been waiting for the last child
+                    threading.Thread(target=self._close, daemon=True).start()
+            elif 'pid' in message:
+                # Register it here, as its exit may be reported before spawn() returns
+                child = ForkedProcess(message['pid'], None)
+                with self._children_lock:
+                    self._children[child.pid] = child
+                self._replies.put(child)
+            else:
+                self._replies.put(message)
+
+        # The template has gone unexpectedly if children are left; they are still running
+        self._replies.put({'error': 'The fork server has exited'})
+        with self._children_lock:
+            children, self._children = list(self._children.values()), dict()
+        for child in children:
+            threading.Thread(target=self._watch_orphan, args=(child,), daemon=True).start()
+
+    @staticmethod
+    def _watch_orphan(child: ForkedProcess, interval=0.1):
+        # The exit status went away with the template, so just wait for the pid to disappear
+        while True:
+            try:
+                os.kill(child.pid, 0)
+            except ProcessLookupError:
+                break
+            except PermissionError:
+                pass
+            time.sleep(interval)
+        child._set_exit(ForkedProcess.lost_code)
+
+
+_bootstrap = (
+    'import json, sys; options = json.loads(sys.argv[1]); sys.path[:] = options["path"]; '
+    'from r3build.forkserver import _main; _main(options)'
+)
+
+
+def _main(options):
+    """Entrypoint of the template process."""
+    sock = socket.socket(fileno=options['fd'])
+    # Ctrl-C of the terminal is for the children; r3build stops the template
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        _Template(sock, options['preload'], options['purge']).serve()
+    except BaseException:
+        traceback.print_exc()
+        sys.exit(1)
+
+
+class _Template:
+    """The main loop of the template process."""
+
+    def __init__(self, sock, preload, purge):
+        self.sock = sock
+        self.preload = preload
+        self.purge = purge
+
+    def serve(self):
+        rfile = self.sock.makefile('r')
+
+        try:
+            for name in self.preload:
+                importlib.import_module(name)
+            # Purge after preloading, as preloaded modules may have imported them
+            for name in self.purge:
+                for m in [m for m in sys.modules if m == name or m.startswith(name + '.')]:
+                    del sys.modules[m]
+        except Exception as e:
+            self.send({'error': repr(e)})
+            return
+
+        files = [getattr(m, '__file__', None) for m in list(sys.modules.values())]
+        self.send({'files': sorted({f for f in files if f})})
+
+        # Get notified of exits of children via a pipe
+        rpipe, wpipe = os.pipe()
+        os.set_blocking(wpipe, False)
+        signal.set_wakeup_fd(wpipe)
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+
+        while True:
+            readable, _, _ = select.select([self.sock, rpipe], [], [])
+            if rpipe in readable:
+                os.read(rpipe, 4096)
+                self.reap()
+            if self.sock in readable:
+                line = rfile.readline()
+                if not line:
+                    return
+                self.fork(json.loads(line), rpipe, wpipe)
+
+    def send(self, message):
+        self.sock.sendall((json.dumps(message) + '\n').encode())
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if os.WIFSIGNALED(status):
+                code = -os.WTERMSIG(status)
+            else:
+                code = os.WEXITSTATUS(status)
+            self.send({'exit': pid, 'code': code})
+
+    def fork(self, request, rpipe, wpipe):
+        # The child closes `ready` after setsid(), so the group exists once the pid is sent
+        ready_r, ready_w = os.pipe()
+        try:
+            pid = os.fork()
+        except OSError as e:
+            os.close(ready_r)
+            os.close(ready_w)
+            self.send({'error': repr(e)})
+            return
+
+        if pid != 0:
+            os.close(ready_w)
+            os.read(ready_r, 1)
+            os.close(ready_r)
+            self.send({'pid': pid})
+            return
+
+        # The child
+        code = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            for fd in [rpipe, wpipe]:
+                os.close(fd)
+            self.sock.close()
+
+            os.close(ready_r)
+            if request['setsid']:
+                os.setsid()
+            os.close(ready_w)
+            if request['quiet']:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, 1)
+                os.dup2(devnull, 2)
+            os.chdir(request['cwd'])
+            os.environ.update(request['env'])
+            importlib.invalidate_caches()
+
+            module, _, fn = request['target'].partition(':')
+            ret = getattr(importlib.import_module(module), fn)(*request['args'])
+            code = ret if isinstance(ret, int) else 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
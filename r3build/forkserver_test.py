@@ -0,0 +1,54 @@
+import os
+import signal
+
+from watchdog.events import FileModifiedEvent
+
+from r3build.cli import R3build
+from r3build.forkserver import ForkServer
+
+
+def test_spawn():
+    r, w = os.pipe()
+    server = ForkServer(preload=['json'])
+    server.start()
+    try:
+        # The template is a fresh interpreter that doesn't inherit the fds of r3build
+        assert server.spawn('os:fstat', [r], quiet=True).wait(10) == 1
+
+        assert any(f.endswith(os.path.join('json', '__init__.py')) for f in server.preloaded_files)
+
+        child = server.spawn('sys:exit', [3], quiet=True)
+        assert child.wait(10) == 3
+
+        child = server.spawn('time:sleep', [100])
+        assert child.poll() is None
+        os.killpg(child.pid, signal.SIGTERM)
+        assert child.wait(10) == -signal.SIGTERM
+    finally:
+        server.stop()
+        os.close(r)
+        os.close(w)
+
+
+def test_pytest_forkserver(tmp_path):
+    test = tmp_path / 'forked_test.py'
+    test.write_text('def test_foo():\n    assert True\n')
+
+    job = {
+        'name': 'forked',
+        'type': 'pytest',
+        'target': str(test),
+        'forkserver': True,
+        'preload': ['json'],
+    }
+    r3 = R3build(config_dict={'job': [job], 'log': {'job_output': False}})
+    processor = r3.get_job('forked').processor
+    processor.open()
+    try:
+        assert processor.on_change(FileModifiedEvent(str(test))).success
+
+        # The next run imports the edited test freshly
+        test.write_text('def test_foo():\n    assert False\n')
+        assert not processor.on_change(FileModifiedEvent(str(test))).success
+    finally:
+        processor.close()
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import ast
+import importlib.util
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+
+class ImportGraph:
+    """Import graph of the Python modules in a package.
+
+    It's built once by parsing the sources (without importing them) and
+    updated incrementally as files change. It tells which test modules
+    import a changed module, directly or indirectly.
+    """
+
+    root: Path  # the directory of the package
+    base: Path  # the directory that module names are relative to
+    test_patterns = ['test_*.py', '*_test.py']
+
+    _raw: Dict[str, FrozenSet[str]]  # module -> names it imports
+    _imports: Dict[str, FrozenSet[str]]  # module -> modules it imports (in the package)
+    _files: Dict[str, str]  # module -> file
+    _modules: Dict[str, str]  # file -> module
+
+    def __init__(self, target):
+        self.root = self.resolve(target)
+        self.base = self.root.parent if (self.root / '__init__.py').exists() else self.root
+        self._raw = dict()
+        self._imports = dict()
+        self._files = dict()
+        self._modules = dict()
+        self.build()
+
+    @staticmethod
+    def resolve(target) -> Path:
+        """Resolve a path or a package name into the absolute path of the directory."""
+        path = Path(target)
+        if not path.exists():
+            spec = importlib.util.find_spec(target)
+            if spec is None or not spec.submodule_search_locations:
+                raise ValueError(f'Cannot find a package directory of "{target}"')
+            path = Path(list(spec.submodule_search_locations)[0])
+        if not path.is_dir():
+            raise ValueError(f'"{target}" is not a directory')
+        return path.absolute()
+
+    def build(self):
+        for file in self.root.rglob('*.py'):
+            self._parse(str(file))
+        self._resolve_all()
+
+    def update(self, paths: Iterable[str]) -> bool:
+        """Reparse the changed files. Returns True if the graph itself has changed."""
+        modules_changed = False
+        imports_changed = False
+        for path in paths:
+            path = str(Path(path).absolute())
+            if not os.path.isfile(path):
+                module = self._modules.pop(path, None)
+                if module is not None:
+                    del self._files[module]
+                    del self._raw[module]
+                    modules_changed = True
+                continue
+
+            module = self._modules.get(path)
+            old = self._raw.get(module)
+            self._parse(path)
+            modules_changed |= module is None
+            imports_changed |= old != self._raw[self._modules[path]]
+
+        if modules_changed or imports_changed:
+            self._resolve_all()
+        return modules_changed or imports_changed
+
+    def select(self, paths: Iterable[str]) -> Optional[List[str]]:
+        """Returns test files affected by the changed paths.
+
+        It returns None when all tests should run; when a conftest.py, a file
+        other than Python modules in the package, or the graph has changed.
+        """
+        paths = [str(Path(p).absolute()) for p in paths]
+        for path in paths:
+            if os.path.basename(path) == 'conftest.py':
+                return None
+            if not path.endswith('.py') or not path.startswith(str(self.root) + os.sep):
+                return None
+
+        if self.update(paths):
+            return None
+
+        importers: Dict[str, Set[str]] = dict()
+        for module, imports in self._imports.items():
+            for imported in imports:
+                importers.setdefault(imported, set()).add(module)
+
+        affected = set()
+        stack = [self._modules[p] for p in paths if p in self._modules]
+        while stack:
+            module = stack.pop()
+            if module in affected:
+                continue
+            affected.add(module)
+            stack.extend(importers.get(module, ()))
+
+        files = (self._files[m] for m in affected)
+        return sorted(f for f in files if self.is_test(f))
+
+    def is_test(self, path):
+        name = os.path.basename(path)
+        return any(fnmatchcase(name, p) for p in self.test_patterns)
+
+    def _module_name(self, path):
+        rel = Path(path).relative_to(self.base).with_suffix('')
+        parts = list(rel.parts)
+        if parts[-1] == '__init__':
+            parts.pop()
+        return '.'.join(parts)
+
+    def _parse(self, path):
+        module = self._module_name(path)
+        self._files[module] = path
+        self._modules[path] = module
+
+        try:
+            with open(path, 'rb') as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (OSError, SyntaxError, ValueError):
+            self._raw[module] = frozenset()
+            return
+
+        is_package = os.path.basename(path) == '__init__.py'
+        package = module if is_package else module.rpartition('.')[0]
+
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    parts = package.split('.') if package else []
+                    parts = parts[: len(parts) - (node.level - 1)]
+                    if node.module:
+                        parts.append(node.module)
+                    origin = '.'.join(parts)
+                else:
+                    origin = node.module or ''
+                names.add(origin)
+                names.update(f'{origin}.{alias.name}' for alias in node.names)
+        self._raw[module] = frozenset(names)
+
+    def _resolve_all(self):
+        self._imports = {module: self._internal(names) for module, names in self._raw.items()}
+
+    def _internal(self, names):
+        # Keep modules in the package, including the parent packages that get imported implicitly
+        result = set()
+        for name in names:
+            parts = name.split('.')
+            for i in range(1, len(parts) + 1):
+                candidate = '.'.join(parts[:i])
+                if candidate in self._files:
+                    result.add(candidate)
+        return frozenset(result)
@@ -0,0 +1,43 @@
+from textwrap import dedent
+
+from r3build.impact import ImportGraph
+
+
+def write(path, text=''):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(dedent(text))
+
+
+def test_select(tmp_path):
+    pkg = tmp_path / 'pkg'
+    write(pkg / '__init__.py')
+    write(pkg / 'base.py')
+    write(pkg / 'foo' / '__init__.py')
+    write(pkg / 'foo' / 'bar.py', 'from ..base import *\n')
+    write(pkg / 'foo' / 'bar_test.py', 'from pkg.foo import bar\n')
+    write(pkg / 'baz.py', 'import pkg.foo.bar\n')
+    write(pkg / 'test_baz.py', 'from . import baz\n')
+    write(pkg / 'test_other.py', 'import os\n')
+    write(pkg / 'conftest.py')
+
+    graph = ImportGraph(str(pkg))
+
+    def select(*names):
+        result = graph.select([str(pkg / n) for n in names])
+        return (
+            result if result is None else [str(p.relative_to(pkg)) for p in map(type(pkg), result)]
+        )
+
+    assert select('foo/bar.py') == ['foo/bar_test.py', 'test_baz.py']
+    assert select('base.py') == ['foo/bar_test.py', 'test_baz.py']
+    assert select('baz.py') == ['test_baz.py']
+    assert select('test_other.py') == ['test_other.py']
+
+    # Full run
+    assert select('conftest.py') is None
+    assert select('data.json') is None
+
+    # The graph has changed; it's a full run once, and the graph is updated
+    write(pkg / 'test_other.py', 'import pkg.base\n')
+    assert select('test_other.py') is None
+    assert select('base.py') == ['foo/bar_test.py', 'test_baz.py', 'test_other.py']
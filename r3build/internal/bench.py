@@ -0,0 +1,68 @@
+import time
+
+import click
+from watchdog.events import FileModifiedEvent
+
+from r3build.cli import R3build
+from r3build.matcher import Matcher
+
+
+def make_config(n_jobs):
+    jobs = [
+        {
+            'name': f'job{i}',
+            'type': 'internaltest',
+            'path': f'/monorepo/pkg{i}',
+            'glob': ['src/**/*.c', 'include/*.h'],
+            'glob_exclude': 'src/generated/*',
+            'regex_exclude': r'\.tmp$',
+            'when': ['created', 'modified'],
+        }
+        for i in range(n_jobs)
+    ]
+    return {'job': jobs}
+
+
+def make_events(n_jobs, n_events):
+    return [
+        FileModifiedEvent(f'/monorepo/pkg{i % n_jobs}/src/module{i}/file{i}.c')
+        for i in range(n_events)
+    ]
+
+
+def dispatch_linear(r3, events):
+    for event in events:
+        abspath = Matcher.normalize(event.src_path)
+        for job in r3.config.job:
+            job.matcher.match(event, abspath)
+
+
+def dispatch_routed(r3, events):
+    for event in events:
+        abspath = Matcher.normalize(event.src_path)
+        for job in r3.router.route(abspath):
+            job.matcher.match(event, abspath)
+
+
+@click.command()
+@click.option('--jobs', default='1,10,20,40,80,160', help='Comma-separated job counts.')
+@click.option('--events', default=10000, help='Number of events to dispatch per run.')
+def cmd(jobs, events):
+    """Measure the dispatch (routing + filtering) time as the job count grows."""
+    print(f'{"jobs":>6} {"linear us/ev":>14} {"routed us/ev":>14} {"speedup":>8}')
+    for n in (int(j) for j in jobs.split(',')):
+        r3 = R3build(config_dict=make_config(n))
+        evs = make_events(n, events)
+
+        results = []
+        for fn in [dispatch_linear, dispatch_routed]:
+            start = time.perf_counter()
+            fn(r3, evs)
+            results.append((time.perf_counter() - start) / len(evs) * 1e6)
+
+        linear, routed = results
+        print(f'{n:>6} {linear:>14.2f} {routed:>14.2f} {linear / routed:>7.1f}x')
+
+
+if __name__ == '__main__':
+    cmd()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import os
+import struct
+import termios
+from typing import Dict, List, Optional, Tuple
+
+
+class JobServer:
+    """A GNU make compatible jobserver shared by the jobs.
+
+    It's a pipe filled with `slots` tokens. A run takes one token while it's
+    running, and make (or anything that speaks the jobserver protocol) takes
+    the pipe from MAKEFLAGS and reads more tokens for its parallel recipes.
+    Thus the total parallelism stays at `slots` however many jobs are running.
+    """
+
+    slots: int
+    fds: Tuple[int, int]  # (read, write)
+
+    _async_fd: Optional[int]  # non-blocking read end for the event loop
+    _waiters: List[asyncio.Future]
+
+    def __init__(self, slots: int):
+        if slots < 1:
+            raise ValueError(f'The jobserver needs at least one slot: {slots}')
+        self.slots = slots
+        self.fds = os.pipe()
+        os.write(self.fds[1], b'+' * slots)
+        self._async_fd = None
+        self._waiters = []
+
+    @property
+    def makeflags(self) -> str:
+        r, w = self.fds
+        # --jobserver-fds is for make before 4.2
+        return f'-j --jobserver-fds={r},{w} --jobserver-auth={r},{w}'
+
+    def environ(self, env: Dict[str, str]) -> Dict[str, str]:
+        """Returns a copy of `env` that points to the jobserver."""
+        env = dict(env)
+        inherited = env.get('MAKEFLAGS', '')
+        env['MAKEFLAGS'] = f'{self.makeflags} {inherited}'.strip()
+        return env
+
+    def acquire(self) -> bytes:
+        """Take a token. It blocks until one is available."""
+        while True:
+            try:
+                token = os.read(self.fds[0], 1)
+            except InterruptedError:
+                continue
+            if token:
+                return token
+
+    async def acquire_async(self) -> bytes:
+        """Take a token without blocking the event loop or a thread.
+
+        The token is read only when the pipe is readable, so a cancelled wait never takes one.
+        """
+        loop = asyncio.get_running_loop()
+        fd = self._nonblocking_fd()
+        while True:
+            try:
+                token = os.read(fd, 1)
+            except (BlockingIOError, InterruptedError):
+                token = b''
+            if token:
+                return token
+
+            future = loop.create_future()
+            if not self._waiters:
+                loop.add_reader(fd, self._wake, loop)
+            self._waiters.append(future)
+            try:
+                await future
+            finally:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    if not self._waiters:
+                        loop.remove_reader(fd)
+
+    def _nonblocking_fd(self):
+        # O_NONBLOCK is shared by the processes using the same open file, and make may
+        # not expect it; reopen the pipe to get an open file of our own
+        if self._async_fd is None:
+            path = f'/proc/self/fd/{self.fds[0]}'
+            self._async_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+        return self._async_fd
+
+    def _wake(self, loop):
+        # All waiters try to read; those who miss wait again
+        loop.remove_reader(self._async_fd)
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    def release(self, token: bytes = b'+'):
+        os.write(self.fds[1], token)
+
+    def in_use(self) -> int:
+        """Number of tokens taken by r3build and its children."""
+        buf = fcntl.ioctl(self.fds[0], termios.FIONREAD, b'\0' * 4)
+        return self.slots - struct.unpack('i', buf)[0]
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        if self._async_fd is not None:
+            os.close(self._async_fd)
+            self._async_fd = None
@@ -0,0 +1,61 @@
+import asyncio
+import subprocess
+
+from watchdog.events import FileModifiedEvent
+
+from r3build.cli import R3build
+from r3build.jobserver import JobServer
+
+
+def test_tokens():
+    js = JobServer(3)
+    try:
+        assert js.in_use() == 0
+        tokens = [js.acquire(), js.acquire()]
+        assert js.in_use() == 2
+        for token in tokens:
+            js.release(token)
+        assert js.in_use() == 0
+        assert '--jobserver-auth=' in js.environ({'MAKEFLAGS': 's'})['MAKEFLAGS']
+    finally:
+        js.close()
+
+
+def test_make_jobserver(tmp_path):
+    makefile = tmp_path / 'Makefile'
+    makefile.write_text('all: a b c\na b c:\n\t@echo "$$MAKEFLAGS" > $@.txt\n')
+
+    job = {'name': 'make', 'type': 'make', 'directory': str(tmp_path), 'path': str(tmp_path)}
+    config = {'job': [job], 'event': {'jobserver': True, 'jobserver_slots': 2}}
+    r3 = R3build(config_dict=config)
+    processor = r3.get_job('make').processor
+    try:
+        assert processor.on_change(FileModifiedEvent(str(makefile))).success
+        assert '--jobserver-auth=' in (tmp_path / 'a.txt').read_text()
+        assert r3.jobserver.in_use() == 0
+    finally:
+        r3.jobserver.close()
+
+
+def test_acquire_async():
+    js = JobServer(1)
+
+    async def _main():
+        token = await js.acquire_async()
+        waiters = [asyncio.create_task(js.acquire_async()) for _ in range(2)]
+        await asyncio.sleep(0.1)
+        assert not any(w.done() for w in waiters)
+
+        # A cancelled waiter doesn't take the token
+        waiters[0].cancel()
+        await asyncio.gather(waiters[0], return_exceptions=True)
+        js.release(token)
+        token = await asyncio.wait_for(waiters[1], 5)
+        assert js.in_use() == 1
+        js.release(token)
+
+    try:
+        asyncio.run(_main())
+        assert js.in_use() == 0
+    finally:
+        js.close()
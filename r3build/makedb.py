@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import re
+import subprocess
+from typing import Dict, Iterable, List, Optional, Set
+
+_rule = re.compile(r'^(?P<target>[^#\s][^:=]*?)::?(?P<prereqs>[^=]*)$')
+
+
+class MakeDatabase:
+    """Dependency graph of a Makefile read from the database of make (`make -pn`).
+
+    It maps changed files to the targets that depend on them, so make can be
+    asked to build just those targets instead of checking the whole graph.
+    """
+
+    directory: str
+    default_goal: str
+    makefiles: Set[str]  # absolute paths of the Makefiles read by make
+    phony: Set[str]
+
+    _prereqs: Dict[str, List[str]]  # target -> prerequisites, as make names them
+    _dependents: Dict[str, Set[str]]  # absolute path -> targets that directly depend on it
+
+    def __init__(self, directory, text):
+        self.directory = os.path.abspath(directory or '.')
+        self.default_goal = ''
+        self.makefiles = set()
+        self.phony = set()
+        self._prereqs = dict()
+        self._dependents = dict()
+        self._parse(text)
+
+    @classmethod
+    def load(cls, directory='', goal='') -> MakeDatabase:
+        """Run `make -pn` and read its database. Recipes are not executed."""
+        cmd = ['make', '-pn']
+        if directory:
+            cmd += ['-C', directory]
+        if goal:
+            cmd.append(goal)
+        proc = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True
+        )
+        if '# Files' not in proc.stdout:
+            raise RuntimeError(f'Failed to read the make database (exit code {proc.returncode})')
+        return cls(directory, proc.stdout)
+
+    def __len__(self):
+        return len(self._prereqs)
+
+    def is_makefile(self, path) -> bool:
+        name = os.path.basename(path)
+        return (
+            path in self.makefiles
+            or name in ('GNUmakefile', 'makefile', 'Makefile')
+            or name.endswith('.mk')
+        )
+
+    def affected(self, paths: Iterable[str], goal='') -> Optional[List[str]]:
+        """Returns the outermost file targets under `goal` that depend on the changed paths.
+
+        It returns None if the changes don't lead to any file target (e.g. a new file
+        or phony targets only), so the caller should build the goal as usual.
+        """
+        goal = goal or self.default_goal
+        reachable = self._closure([goal]) if goal in self._prereqs else set(self._prereqs)
+
+        affected = self._affected_by([self._abspath(p) for p in paths]) & reachable
+        candidates = {t for t in affected if t not in self.phony}
+        # A target is rebuilt by another candidate if it's one of its prerequisites
+        inner = set()
+        for target in candidates:
+            inner |= self._closure(self._prereqs[target])
+        targets = sorted(candidates - inner)
+        return targets or None
+
+    def _affected_by(self, paths):
+        result = set()
+        stack = list(paths)
+        while stack:
+            for target in self._dependents.get(stack.pop(), ()):
+                if target not in result:
+                    result.add(target)
+                    stack.append(self._abspath(target))
+        return result
+
+    def _closure(self, targets):
+        result = set()
+        stack = list(targets)
+        while stack:
+            target = stack.pop()
+            if target in result or target not in self._prereqs:
+                continue
+            result.add(target)
+            stack.extend(self._prereqs[target])
+        return result
+
+    def _abspath(self, name):
+        return os.path.normpath(os.path.join(self.directory, name))
+
+    def _parse(self, text):
+        in_files = False
+        not_target = False
+        for line in text.splitlines():
+            if line.startswith('MAKEFILE_LIST :='):
+                self.makefiles = {self._abspath(f) for f in line.split(':=', 1)[1].split()}
+            elif line.startswith('.DEFAULT_GOAL :='):
+                self.default_goal = line.split(':=', 1)[1].strip()
+            elif line == '# Files':
+                in_files = True
+            elif line.startswith('# files hash-table stats'):
+                in_files = False
+            elif not in_files:
+                continue
+            elif line == '# Not a target:':
+                not_target = True
+            elif not line or line[0] in '#\t':
+                continue
+            else:
+                m = _rule.match(line)
+                if m and not not_target:
+                    self._add_rule(m.group('target').strip(), m.group('prereqs'))
+                not_target = False
+
+    def _add_rule(self, target, prereqs):
+        # Order-only prerequisites after "|" don't make the target out of date
+        prereqs = prereqs.split('|', 1)[0].split()
+        if target == '.PHONY':
+            self.phony.update(prereqs)
+            return
+        if target.startswith('.') and '/' not in target:
+            # Special targets and suffix rules
+            return
+
+        self._prereqs[target] = prereqs
+        for prereq in prereqs:
+            self._dependents.setdefault(self._abspath(prereq), set()).add(target)
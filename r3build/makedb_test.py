@@ -0,0 +1,65 @@
+from watchdog.events import FileModifiedEvent
+
+from r3build.cli import R3build
+from r3build.makedb import MakeDatabase
+
+MAKEFILE = '''.PHONY: all
+all: app lib.a
+
+app: main.o util.o
+\tcat $^ > $@
+
+lib.a: util.o
+\tcat $^ > $@
+
+%.o: %.c common.h
+\tcat $< > $@
+'''
+
+
+def test_affected(tmp_path):
+    (tmp_path / 'Makefile').write_text(MAKEFILE)
+    for name in ['main.c', 'util.c', 'common.h']:
+        (tmp_path / name).write_text(name)
+
+    db = MakeDatabase.load(str(tmp_path))
+    assert db.default_goal == 'all'
+    assert db.phony == {'all'}
+    assert db.is_makefile(str(tmp_path / 'Makefile'))
+
+    def affected(name, goal=''):
+        return db.affected([str(tmp_path / name)], goal)
+
+    assert affected('main.c') == ['app']
+    assert affected('common.h') == ['app', 'lib.a']
+    assert affected('common.h', 'lib.a') == ['lib.a']
+    assert affected('main.o') == ['app']
+    assert affected('unknown.c') is None
+
+
+def test_make_infer_targets(tmp_path):
+    (tmp_path / 'Makefile').write_text(MAKEFILE)
+    for name in ['main.c', 'util.c', 'common.h']:
+        (tmp_path / name).write_text(name)
+
+    job = {
+        'name': 'make',
+        'type': 'make',
+        'directory': str(tmp_path),
+        'path': str(tmp_path),
+        'infer_targets': True,
+    }
+    r3 = R3build(config_dict={'job': [job], 'log': {'job_output': False}})
+    processor = r3.get_job('make').processor
+    processor.open()
+
+    assert processor.on_change(FileModifiedEvent(str(tmp_path / 'util.c'))).success
+    assert (tmp_path / 'lib.a').exists()
+    assert (tmp_path / 'app').exists()
+
+    (tmp_path / 'lib.a').unlink()
+    (tmp_path / 'main.c').write_text('main2')
+    assert processor.on_change(FileModifiedEvent(str(tmp_path / 'main.c'))).success
+    assert 'main2' in (tmp_path / 'app').read_text()
+    # lib.a isn't affected by main.c
+    assert not (tmp_path / 'lib.a').exists()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import re
+from fnmatch import translate
+from pathlib import Path
+from typing import FrozenSet, List, Optional, Pattern, Union
+
+from watchdog.events import FileSystemEvent
+
+
+def _as_list(v: Union[List[str], str]) -> List[str]:
+    if isinstance(v, list):
+        return [p for p in v if p]
+    return [v] if v else []
+
+
+class Matcher:
+    """Precompiled event filter of a job.
+
+    All of glob, glob_exclude, regex, regex_exclude and when are compiled
+    once when the config gets loaded. Glob patterns are translated into a
+    single regex so a path is tested with one match() call, and the path of
+    an event is normalized only once per event.
+    """
+
+    glob_patterns: List[str]
+    glob: Optional[Pattern]
+    glob_exclude: Optional[Pattern]
+    regex: List[Pattern]
+    regex_exclude: List[Pattern]
+    when: FrozenSet[str]
+
+    def __init__(self, glob, glob_exclude, regex, regex_exclude, when):
+        self.glob_patterns = [str(Path(p).absolute()) for p in _as_list(glob)]
+        self.glob = self._compile_glob(self.glob_patterns)
+        self.glob_exclude = self._compile_glob(_as_list(glob_exclude))
+        self.regex = [re.compile(p) for p in _as_list(regex)]
+        self.regex_exclude = [re.compile(p) for p in _as_list(regex_exclude)]
+        self.when = frozenset(_as_list(when))
+
+    @staticmethod
+    def _compile_glob(patterns) -> Optional[Pattern]:
+        if not patterns:
+            return None
+        translated = (translate(str(Path(p).absolute())) for p in patterns)
+        return re.compile('|'.join(f'(?:{t})' for t in translated))
+
+    @staticmethod
+    def normalize(path):
+        return str(Path(path).absolute())
+
+    def match(self, event: FileSystemEvent, abspath=None) -> bool:
+        """Returns True if the event passes all filters.
+
+        `abspath` is the normalized path of the event. It's computed here if
+        it's not given.
+        """
+        if self.when and event.event_type not in self.when:
+            return False
+
+        if self.glob or self.glob_exclude:
+            if abspath is None:
+                abspath = self.normalize(event.src_path)
+            if self.glob and not self.glob.match(abspath):
+                return False
+            if self.glob_exclude and self.glob_exclude.match(abspath):
+                return False
+
+        src_path = event.src_path
+        if self.regex and not any(r.search(src_path) for r in self.regex):
+            return False
+        if self.regex_exclude and any(r.search(src_path) for r in self.regex_exclude):
+            return False
+
+        return True
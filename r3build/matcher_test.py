@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+from r3build.matcher import Matcher
+
+
+def test_glob():
+    m = Matcher(['/foo/*.c', '/foo/*.h'], '/foo/extra/*', '', '', '')
+
+    assert m.match(FileModifiedEvent('/foo/a.c'))
+    assert m.match(FileModifiedEvent('/foo/bar/a.h'))
+    assert not m.match(FileModifiedEvent('/foo/a.py'))
+    assert not m.match(FileModifiedEvent('/foo/extra/a.c'))
+
+    # Relative paths are compared after being made absolute
+    m = Matcher(str(Path('foo/*.c').absolute()), '', '', '', '')
+    assert m.match(FileModifiedEvent('foo/a.c'))
+
+
+def test_regex_and_when():
+    m = Matcher('', '', r'.+\.py$', [r'/env/'], ['created'])
+
+    assert m.match(FileCreatedEvent('/foo/a.py'))
+    assert not m.match(FileModifiedEvent('/foo/a.py'))
+    assert not m.match(FileCreatedEvent('/foo/a.pyc'))
+    assert not m.match(FileCreatedEvent('/foo/env/a.py'))
+
+    m = Matcher('', '', '', '', '')
+    assert m.match(FileModifiedEvent('/anything'))
@@ -1,22 +1,53 @@
 from __future__ import annotations
 
+import asyncio
 import importlib
+import json
 import os
+import re
+import shlex
 import signal
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
+from datetime import timedelta
 from enum import IntEnum
-from multiprocessing import cpu_count
+from functools import lru_cache
+from multiprocessing import cpu_count, get_context
 from subprocess import Popen
-from typing import Optional, Set
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from watchdog.events import FileSystemEvent
 
+from r3build.daemon import DaemonInstance, ReadinessProbe, stop_all, stop_all_async
+from r3build.depfile import read_inputs
+from r3build.forkserver import ForkServer
+from r3build.impact import ImportGraph
+from r3build.jobserver import JobServer
+from r3build.makedb import MakeDatabase
 from r3build.prompter import Prompter
+from r3build.shard import read_lines, split
+from r3build.sync import Mirror
 from r3build.config_class import *
 
+# Characters that need /bin/sh to interpret the command line
+_shell_syntax = re.compile(r'[|&;<>()$`\\*?\[\]{}~#!\n]')
+_shell_builtins = frozenset(
+    '. : alias break case cd command continue eval exec exit export for if read return set shift '
+    'source trap ulimit umask unset until wait while'.split()
+)
+
+
+class Cancelled(Exception):
+    """Cancelled is raised from on_change when the run was cancelled by cancel()."""
+
+    pass
+
 
 class Processor:
     id: str
@@ -25,10 +56,24 @@ class Processor:
 
     _prompter: Prompter
 
+    _procs: Dict[Popen, bool]  # running processes and whether they are cancelled
+    _procs_lock: threading.Lock
+    _generation: int  # incremented on every cancel()
+    _local: threading.local
+
+    cancel_timeout: float = 5.0
+    _base_env: Optional[Dict[str, str]] = None  # os.environ with the environment of the job
+    jobserver: Optional[JobServer] = None  # shared by the jobs if it's enabled
+    inputs: Optional[Set[str]] = None  # absolute paths that trigger the job; any path if None
+
     def __init__(self, root_config, job_config, prompter: Prompter):
         self._root_config = root_config
         self._config = job_config
         self._prompter = prompter
+        self._procs = dict()
+        self._procs_lock = threading.Lock()
+        self._generation = 0
+        self._local = threading.local()
 
     def open(self):
         """close is the start-up function that runs in the beginning of operation. Implementation is optional."""
@@ -38,27 +83,254 @@ class Processor:
         """on_change is the entrypoint for an incoming event. Derived classes must impelemnt it."""
         raise NotImplementedError
 
+    def on_change_batch(self, events: List[FileSystemEvent]) -> ProcessorResult:
+        """on_change_batch is the entrypoint for a batch of incoming events.
+
+        The default implementation runs on_change once with the latest event.
+        Override it to handle all events in the batch at once.
+        """
+        return self.on_change(events[-1])
+
+    def begin(self, generation=None):
+        """begin marks the start of a run in the current thread. Runs begun before cancel() get cancelled.
+
+        If `generation` is given, the run is treated as it had begun when the generation was taken.
+        """
+        with self._procs_lock:
+            self._local.generation = self._generation if generation is None else generation
+
+    def cancel(self):
+        """cancel aborts the running on_change calls. They raise Cancelled.
+
+        The default implementation kills the process groups launched by _helper_run
+        and prevents runs that have begun from launching new ones.
+        Processors that run something else should override it. Implementation is optional.
+        """
+        with self._procs_lock:
+            self._generation += 1
+            procs = list(self._procs.keys())
+            for proc in procs:
+                self._procs[proc] = True
+
+        for proc in procs:
+            self._killpg(proc, signal.SIGTERM)
+            timer = threading.Timer(self.cancel_timeout, self._killpg, (proc, signal.SIGKILL))
+            timer.daemon = True
+            timer.start()
+
     def close(self):
         """close is the clean-up function that runs very before r3build exits. Implementation is optional."""
         pass
 
+    # -- Interface for the asyncio engine (r3build.aio) --
+
+    async def open_async(self):
+        """open_async is open for the asyncio engine. By default, it runs open() in a thread."""
+        await asyncio.get_running_loop().run_in_executor(None, self.open)
+
+    async def on_change_batch_async(self, events: List[FileSystemEvent]) -> ProcessorResult:
+        """on_change_batch_async is on_change_batch for the asyncio engine.
+
+        By default, it runs on_change_batch() in a thread and calls cancel() if it gets cancelled.
+        Processors that can await their work natively should override it.
+        """
+        generation = self._generation
+
+        def _run():
+            self.begin(generation)
+            return self.on_change_batch(events)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, _run)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+    async def close_async(self):
+        """close_async is close for the asyncio engine. By default, it runs close() in a thread."""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
     def _helper_run(self, cmd, **kwargs):
+        """Run the command in a new process group and wait for it.
+
+        It raises Cancelled if the process was killed by cancel().
+        If the command can't be executed, it returns 127 (or 126) as /bin/sh does.
+        """
+        if not self._root_config.log.job_output:
+            kwargs['stdout'] = subprocess.DEVNULL
+            kwargs['stderr'] = subprocess.DEVNULL
+
+        try:
+            proc = self._helper_wait(lambda: Popen(cmd, start_new_session=True, **kwargs))
+        except OSError as e:
+            return subprocess.CompletedProcess(cmd, self._helper_exec_failed(cmd, e))
+        return subprocess.CompletedProcess(proc.args, proc.returncode)
+
+    def _helper_exec_failed(self, argv, e: OSError):
+        # Report the failure to execute the command like /bin/sh, and returns its exit code
+        name = e.filename or argv[0]
+        if isinstance(e, PermissionError):
+            self._prompter.procerr(self._config.name, f'{name}: Permission denied')
+            return 126
+        if isinstance(e, FileNotFoundError):
+            self._prompter.procerr(self._config.name, f'{name}: not found')
+            return 127
+        self._prompter.procerr(self._config.name, f'{name}: {e.strerror or e!r}')
+        return 126
+
+    def _helper_wait(self, spawn):
+        """Launch a process with `spawn` and wait for it, so cancel() can kill it.
+
+        `spawn` must return a Popen-like object (pid, poll and wait) that leads a new process group.
+        It raises Cancelled if the process was killed by cancel().
+        """
+        with self._procs_lock:
+            if getattr(self._local, 'generation', self._generation) != self._generation:
+                raise Cancelled
+            proc = spawn()
+            self._procs[proc] = False
+        try:
+            proc.wait()
+        finally:
+            with self._procs_lock:
+                cancelled = self._procs.pop(proc)
+
+        if cancelled:
+            raise Cancelled
+        return proc
+
+    async def _helper_run_async(self, argv, **kwargs):
+        """Run the command in a new process group and await its exit code.
+
+        It returns 127 (or 126) if the command can't be executed, as _helper_run does.
+        If the caller gets cancelled, the process group is terminated (and killed after a timeout).
+        """
         if not self._root_config.log.job_output:
             kwargs['stdout'] = subprocess.DEVNULL
             kwargs['stderr'] = subprocess.DEVNULL
-        return subprocess.run(cmd, **kwargs)
+
+        try:
+            proc = await asyncio.create_subprocess_exec(*argv, start_new_session=True, **kwargs)
+        except OSError as e:
+            return self._helper_exec_failed(argv, e)
+        try:
+            return await proc.wait()
+        except asyncio.CancelledError:
+            await self._helper_terminate_async(proc, signal.SIGTERM, self.cancel_timeout)
+            raise
+
+    @staticmethod
+    async def _helper_terminate_async(proc: asyncio.subprocess.Process, sig, timeout):
+        # Send the signal to the process group once, and await the exit until the timeout
+        try:
+            os.killpg(proc.pid, sig)
+            await asyncio.wait_for(proc.wait(), timeout)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+
+    @contextmanager
+    def _helper_jobserver(self, env):
+        """Take a token of the jobserver during a run, and yield keyword arguments to launch it.
+
+        The arguments pass the jobserver to the process through MAKEFLAGS.
+        If the jobserver is disabled, it yields `env` as it is.
+        """
+        if self.jobserver is None:
+            yield dict(env=env)
+            return
+
+        token = self.jobserver.acquire()
+        try:
+            self._log_jobserver()
+            yield dict(env=self.jobserver.environ(env), pass_fds=self.jobserver.fds)
+        finally:
+            self.jobserver.release(token)
+
+    @asynccontextmanager
+    async def _helper_jobserver_async(self, env):
+        """_helper_jobserver for the asyncio engine."""
+        if self.jobserver is None:
+            yield dict(env=env)
+            return
+
+        token = await self.jobserver.acquire_async()
+        try:
+            self._log_jobserver()
+            yield dict(env=self.jobserver.environ(env), pass_fds=self.jobserver.fds)
+        finally:
+            self.jobserver.release(token)
+
+    def _log_jobserver(self):
+        if not self._root_config.log.jobserver:
+            return
+        js = self.jobserver
+        self._prompter.procsay(
+            self._config.name, f'Jobserver: {js.in_use()}/{js.slots} tokens in use'
+        )
+
+    @staticmethod
+    def _killpg(proc: Popen, sig):
+        if proc.poll() is not None:
+            return
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    @contextmanager
+    def _helper_manifest(events: List[FileSystemEvent]):
+        """Write changed paths into a temporary file, one per line, and yield its name."""
+        paths = {}
+        for event in events:
+            paths[event.src_path] = None
+            if event.event_type == 'moved':
+                paths[event.dest_path] = None
+
+        with tempfile.NamedTemporaryFile('w', prefix='r3build-', suffix='.txt') as f:
+            f.write(''.join(f'{p}\n' for p in paths))
+            f.flush()
+            yield f.name
 
     @staticmethod
-    def _helper_merge_env(config, event: FileSystemEvent):
-        env = os.environ
-        env.update(config.environment)
+    @lru_cache(maxsize=256)
+    def _helper_argv(cmd) -> Tuple[str, ...]:
+        """Split the command line into argv, so it runs without /bin/sh.
+
+        Commands that need a shell (operators, expansions, builtins, etc.) run by /bin/sh -c.
+        """
+        if not _shell_syntax.search(cmd):
+            try:
+                argv = shlex.split(cmd)
+            except ValueError:
+                argv = []
+            if argv and argv[0] not in _shell_builtins and '=' not in argv[0]:
+                return tuple(argv)
+        return ('/bin/sh', '-c', cmd)
+
+    def _helper_merge_env(self, config, events: List[FileSystemEvent], manifest=None):
+        """Returns a new environment for a run. The environment of r3build is left as it is."""
+        if self._base_env is None:
+            self._base_env = dict(os.environ, **(config.environment or dict()))
+
+        event = events[-1]
+        env = dict(self._base_env)
         env.update(
             {
                 'R3_EVENT': event.event_type,
                 'R3_FILENAME': event.src_path,
                 'R3_IS_DIRECTORY': '1' if event.is_directory else '0',
+                'R3_EVENT_COUNT': str(len(events)),
             }
         )
+        if manifest:
+            env['R3_CHANGED_FILES'] = manifest
         return env
 
 
@@ -77,23 +349,105 @@ class MakeProcessor(Processor):
     optional_keys = {'target', 'environment', 'jobs'}
 
     _config: MakeProcessorConfig
+    _db: Optional[MakeDatabase] = None
+
+    def open(self):
+        if self._config.infer_targets:
+            self._load_database()
+        if self._config.depfiles:
+            self._load_inputs()
+            if self.inputs is not None:
+                self._prompter.procsay(
+                    self._config.name, f'Read {len(self.inputs)} inputs from the depfiles'
+                )
 
     def on_change(self, event: FileSystemEvent):
-        jobs = self._config.jobs
-        if jobs == 0:
-            jobs = str(cpu_count())
-        else:
-            jobs = str(jobs)
+        return self.on_change_batch([event])
+
+    def on_change_batch(self, events: List[FileSystemEvent]):
+        target = self._infer_target(events)
+        with self._helper_manifest(events) as manifest:
+            env = self._helper_merge_env(self._config, events, manifest)
+            with self._helper_jobserver(env) as kwargs:
+                ret = self._helper_run(self._helper_argv(self._command(target)), **kwargs)
+        if ret.returncode == 0 and self._config.depfiles:
+            self._load_inputs()
+        return ProcessorResult(success=ret.returncode == 0)
 
+    async def on_change_batch_async(self, events: List[FileSystemEvent]):
+        target = await asyncio.get_running_loop().run_in_executor(None, self._infer_target, events)
+        with self._helper_manifest(events) as manifest:
+            env = self._helper_merge_env(self._config, events, manifest)
+            async with self._helper_jobserver_async(env) as kwargs:
+                argv = self._helper_argv(self._command(target))
+                ret = await self._helper_run_async(argv, **kwargs)
+        if ret == 0 and self._config.depfiles:
+            await asyncio.get_running_loop().run_in_executor(None, self._load_inputs)
+        return ProcessorResult(success=ret == 0)
+
+    def _infer_target(self, events: List[FileSystemEvent]):
+        # Returns the targets affected by the events, or the configured target
         target = self._config.target
+        if not self._config.infer_targets:
+            return target
+
+        paths = [e.src_path for e in events]
+        paths += [e.dest_path for e in events if e.event_type == 'moved']
+        paths = [os.path.abspath(p) for p in paths]
+        if self._db is None or any(self._db.is_makefile(p) for p in paths):
+            self._load_database()
+            return target
+
+        targets = self._db.affected(paths, target)
+        if not targets:
+            return target
+        self._prompter.procsay(self._config.name, f'Building {len(targets)} affected targets')
+        return ' '.join(shlex.quote(t) for t in targets)
+
+    def _load_database(self):
+        try:
+            self._db = MakeDatabase.load(self._config.directory, self._config.target)
+        except (OSError, RuntimeError) as e:
+            self._db = None
+            self._prompter.procerr(self._config.name, f'Error: {e}')
+            return
+        self._prompter.procsay(
+            self._config.name, f'Loaded the make database ({len(self._db)} targets)'
+        )
+
+    def _load_inputs(self):
+        depfiles = self._config.depfiles
+        if isinstance(depfiles, str):
+            depfiles = [depfiles]
+        directory = os.path.abspath(self._config.directory or '.')
+        inputs = read_inputs(depfiles, directory)
+        if not inputs:
+            # Nothing has been built yet
+            self.inputs = None
+            return
 
+        inputs.update(os.path.join(directory, n) for n in ('GNUmakefile', 'makefile', 'Makefile'))
+        if self._db is not None:
+            inputs |= self._db.makefiles
+        # Swap the whole set, as the watcher thread reads it
+        self.inputs = inputs
+
+    def _command(self, target):
         directory = self._config.directory
         if directory:
             directory = f'-C {directory}'
 
-        cmd = f'make -j{jobs} {directory} {target}'.strip()
-        env = self._helper_merge_env(self._config, event)
-        return ProcessorResult(success=self._helper_run(cmd, shell=True, env=env).returncode == 0)
+        if self.jobserver is not None:
+            # make takes the parallelism from the jobserver in MAKEFLAGS
+            return f'make {directory} {target}'.strip()
+
+        jobs = self._config.jobs
+        if jobs == 0:
+            jobs = str(cpu_count())
+        else:
+            jobs = str(jobs)
+
+        return f'make -j{jobs} {directory} {target}'.strip()
 
 
 class PytestProcessor(Processor):
@@ -101,17 +455,123 @@ class PytestProcessor(Processor):
     mendatory_keys = {'target'}
 
     _config: PytestProcessorConfig
+    _server: Optional[ForkServer] = None
+    _graph: Optional[ImportGraph] = None
+    _durations: Dict[str, float]  # node ID -> duration in the last run
+
+    def __init__(self, root_config, job_config: PytestProcessorConfig, prompter):
+        super().__init__(root_config, job_config, prompter)
+        self._durations = dict()
+
+    def open(self):
+        if self._config.impact:
+            self._graph = ImportGraph(self._config.target)
+        if self._config.forkserver:
+            self._server = ForkServer(
+                preload=['pytest'] + self._config.preload,
+                purge=[self._config.target],
+            )
+            self._server.start()
+            self._prompter.procsay(
+                self._config.name,
+                f'Fork server is ready ({len(self._server.preloaded_files)} modules preloaded)',
+            )
+
+    def close(self):
+        if self._server:
+            self._server.stop()
+            self._server = None
 
     def on_change(self, event: FileSystemEvent):
+        return self.on_change_batch([event])
+
+    def on_change_batch(self, events: List[FileSystemEvent]):
+        args = [self._config.target]
+        if self._graph:
+            paths = [e.src_path for e in events]
+            paths += [e.dest_path for e in events if e.event_type == 'moved']
+            selected = self._graph.select(paths)
+            if selected == []:
+                return ProcessorResult(success=True, message='No tests affected')
+            if selected is not None:
+                self._prompter.procsay(
+                    self._config.name, f'Running {len(selected)} affected test files'
+                )
+                args = selected
+
+        workers = self._config.workers or cpu_count()
+        if workers > 1:
+            return self._on_change_sharded(args, workers)
+
+        if self._server:
+            return self._on_change_forkserver(args)
+
         import pytest
 
         pytest_target = self._config.target
         modules = [v for k, v in sys.modules.items() if k.startswith(pytest_target)]
         for m in modules:
             importlib.reload(m)
-        exitcode = pytest.main([pytest_target])
+        exitcode = pytest.main(args)
         return ProcessorResult(success=exitcode == 0)
 
+    def _on_change_forkserver(self, args):
+        # Every run gets a fresh process forked from the warm template
+        def _spawn():
+            quiet = not self._root_config.log.job_output
+            return self._server.spawn('pytest:main', [args], quiet=quiet)
+
+        return ProcessorResult(success=self._helper_wait(_spawn).returncode == 0)
+
+    def _on_change_sharded(self, args, workers):
+        generation = getattr(self._local, 'generation', self._generation)
+
+        with tempfile.TemporaryDirectory(prefix='r3build-') as tmp:
+            collect = os.path.join(tmp, 'collect.txt')
+            ret = self._run_worker(['--collect-only', '-q'] + args, {'R3_PYTEST_COLLECT': collect})
+            if ret != 0:
+                return ProcessorResult(success=False, message=f'Collection failed ({ret})')
+
+            items = read_lines(collect)
+            shards = split(items, workers, self._durations)
+            self._prompter.procsay(
+                self._config.name, f'Running {len(items)} tests on {len(shards)} workers'
+            )
+
+            def _run(i):
+                self.begin(generation)
+                shard = os.path.join(tmp, f'shard-{i}.txt')
+                with open(shard, 'w') as f:
+                    f.write(''.join(f'{item}\n' for item in shards[i]))
+                env = {
+                    'R3_PYTEST_SHARD': shard,
+                    'R3_PYTEST_DURATIONS': os.path.join(tmp, f'durations-{i}.json'),
+                }
+                return self._run_worker(args, env, quiet=not self._root_config.log.job_output)
+
+            with ThreadPoolExecutor(len(shards), thread_name_prefix='r3build-pytest') as pool:
+                codes = list(pool.map(_run, range(len(shards))))
+
+            for i in range(len(shards)):
+                try:
+                    with open(os.path.join(tmp, f'durations-{i}.json')) as f:
+                        self._durations.update(json.load(f))
+                except (OSError, ValueError):
+                    pass
+
+        return ProcessorResult(success=all(c == 0 for c in codes))
+
+    def _run_worker(self, args, env, quiet=True):
+        # Run pytest with the shard plugin in a new process and return its exit code
+        args = ['-p', 'r3build.shard'] + args
+        if self._server:
+            spawn = lambda: self._server.spawn('pytest:main', [args], env=env, quiet=quiet)
+            return self._helper_wait(spawn).returncode
+
+        kwargs = dict(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) if quiet else dict()
+        cmd = [sys.executable, '-m', 'pytest'] + args
+        return self._helper_run(cmd, env=dict(os.environ, **env), **kwargs).returncode
+
 
 class CommandProcessor(Processor):
     id = 'command'
@@ -120,21 +580,133 @@ class CommandProcessor(Processor):
 
     _config: CommandProcessorConfig
 
+    placeholder = '{files}'
+    max_arg_strlen = 131072  # MAX_ARG_STRLEN of Linux; the limit of a single argument
+
     def on_change(self, event: FileSystemEvent):
+        return self.on_change_batch([event])
+
+    def on_change_batch(self, events: List[FileSystemEvent]):
+        with self._helper_manifest(events) as manifest:
+            env = self._helper_merge_env(self._config, events, manifest)
+            commands = self._commands(events, env)
+            if not commands:
+                return ProcessorResult(success=True, message='No files to process')
+
+            generation = getattr(self._local, 'generation', self._generation)
+
+            def _run(argv):
+                self.begin(generation)
+                with self._helper_jobserver(env) as kwargs:
+                    return self._helper_run(argv, **kwargs).returncode
+
+            if len(commands) == 1:
+                codes = [_run(commands[0])]
+            else:
+                workers = min(self._config.files_parallel or cpu_count(), len(commands))
+                with ThreadPoolExecutor(workers, thread_name_prefix='r3build-command') as pool:
+                    codes = list(pool.map(_run, commands))
+        return self._result(codes)
+
+    async def on_change_batch_async(self, events: List[FileSystemEvent]):
+        with self._helper_manifest(events) as manifest:
+            env = self._helper_merge_env(self._config, events, manifest)
+            commands = self._commands(events, env)
+            if not commands:
+                return ProcessorResult(success=True, message='No files to process')
+
+            semaphore = asyncio.Semaphore(self._config.files_parallel or cpu_count())
+
+            async def _run(argv):
+                async with semaphore, self._helper_jobserver_async(env) as kwargs:
+                    return await self._helper_run_async(argv, **kwargs)
+
+            codes = await asyncio.gather(*[_run(argv) for argv in commands])
+        return self._result(codes)
+
+    def _commands(self, events: List[FileSystemEvent], env):
+        # Returns argv of each run; one per chunk of files if the command has the placeholder
         cmd = self._config.command
-        env = self._helper_merge_env(self._config, event)
-        return ProcessorResult(success=self._helper_run(cmd, shell=True, env=env).returncode == 0)
+        if self.placeholder not in cmd:
+            return [self._helper_argv(cmd)]
+
+        # Paths that exist after the events
+        paths = {}
+        for event in events:
+            if event.event_type == 'moved':
+                paths[event.dest_path] = None
+            elif event.event_type != 'deleted':
+                paths[event.src_path] = None
+        if not paths:
+            return []
+
+        # The placeholder itself isn't shell syntax
+        shell = self._helper_argv(cmd.replace(self.placeholder, '_'))[0] == '/bin/sh'
+        template = () if shell else tuple(shlex.split(cmd))
+        shell = shell or self.placeholder not in template
+        chunks = self._chunks(list(paths), env, len(cmd), shell)
+        if len(chunks) > 1:
+            self._prompter.procsay(
+                self._config.name, f'Running {len(paths)} files in {len(chunks)} chunks'
+            )
+
+        if shell:
+            return [
+                ('/bin/sh', '-c', cmd.replace(self.placeholder, ' '.join(chunk)))
+                for chunk in chunks
+            ]
+        i = template.index(self.placeholder)
+        return [template[:i] + tuple(chunk) + template[i + 1 :] for chunk in chunks]
+
+    def _chunks(self, paths, env, length, shell):
+        # Split paths so that a command line stays under ARG_MAX (and MAX_ARG_STRLEN for sh -c)
+        if shell:
+            paths = [shlex.quote(p) for p in paths]
+        env_size = sum(len(k) + len(v) + 2 + 8 for k, v in env.items())
+        budget = os.sysconf('SC_ARG_MAX') - env_size - length - 4096
+        if shell:
+            budget = min(budget, self.max_arg_strlen - length - 1)
+        limit = self._config.files_chunk_size
+
+        chunks = [[]]
+        size = 0
+        for path in paths:
+            # Each argument takes its pointer in argv (or a space in sh -c) and a terminator
+            cost = len(path.encode()) + (1 if shell else 9)
+            if chunks[-1] and (size + cost > budget or len(chunks[-1]) == limit):
+                chunks.append([])
+                size = 0
+            chunks[-1].append(path)
+            size += cost
+        return chunks
+
+    @staticmethod
+    def _result(codes):
+        if len(codes) == 1 or all(c == 0 for c in codes):
+            return ProcessorResult(success=all(c == 0 for c in codes))
+        failed = sum(1 for c in codes if c != 0)
+        message = f'{failed}/{len(codes)} chunks failed (exit codes: {", ".join(map(str, codes))})'
+        return ProcessorResult(success=False, message=message)
 
 
 class DaemonProcessor(Processor):
     id = 'daemon'
-    mendatory_keys = {'command'}
-    optional_keys = {'signal', 'environment'}
+    optional_keys = {'command', 'python_entry', 'signal', 'environment'}
 
     _config: DaemonProcessorConfig
 
     _signal: int = None
-    _child_process: Optional[Popen] = None
+    _probe: ReadinessProbe
+    _replicas: List[Optional[DaemonInstance]]
+    _server: Optional[ForkServer] = None  # the template of python_entry
+    _stamps: Dict[str, int]  # preloaded file -> mtime when the template was built
+
+    _lock: threading.Lock  # guards swapping replicas against the supervision
+    _closing: bool
+    _revive_timers: Dict[int, threading.Timer]
+    _streaks: List[int]  # crashes in a row of each replica, for the backoff
+    restarts: int
+    crashes: int
 
     def __init__(self, root_config, job_config: DaemonProcessorConfig, prompter):
         super().__init__(root_config, job_config, prompter)
@@ -151,80 +723,401 @@ class DaemonProcessor(Processor):
                 raise ValueError(f'Signal {job_config.signal} is not available.')
             self._signal = signals_str[job_config.signal]
 
+        if job_config.restart_strategy not in ('stop-first', 'start-first'):
+            raise ValueError(f'Unknown restart strategy: "{job_config.restart_strategy}"')
+        if job_config.restart_policy not in ('no', 'on-failure', 'always'):
+            raise ValueError(f'Unknown restart policy: "{job_config.restart_policy}"')
+        if bool(job_config.command) == bool(job_config.python_entry):
+            raise ValueError('Specify either command or python_entry of the daemon')
+        if job_config.python_entry and job_config.ready_pattern:
+            raise ValueError('ready_pattern is not available with python_entry')
+        if job_config.ready_port and not os.path.exists('/proc/net/tcp'):
+            raise ValueError('ready_port needs /proc to tell which process listens on the port')
+        if job_config.replicas < 1 or job_config.rolling_batch < 1:
+            raise ValueError('replicas and rolling_batch must be positive')
+
+        self._probe = ReadinessProbe(
+            port=job_config.ready_port,
+            pattern=job_config.ready_pattern,
+            file=job_config.ready_file,
+            timeout=job_config.ready_timeout,
+        )
+
+        self._replicas = [None] * job_config.replicas
+        self._lock = threading.Lock()
+        self._closing = False
+        self._revive_timers = dict()
+        self._streaks = [0] * job_config.replicas
+        self._stamps = dict()
+        self.restarts = 0
+        self.crashes = 0
+
+    @property
+    def _child_process(self) -> Optional[DaemonInstance]:
+        """The first replica."""
+        return self._replicas[0]
+
+    @property
+    def uptime(self) -> float:
+        """Seconds since the latest start among the replicas."""
+        uptimes = [r.uptime for r in self._replicas if r is not None]
+        return min(uptimes) if uptimes else 0.0
+
     def open(self):
-        self._start()
-        self._prompter.procsay(self._config.name, f'Started: `{self._config.command}`')
+        self._closing = False
+        if self._config.python_entry:
+            self._start_template()
+        with self._lock:
+            for i in range(len(self._replicas)):
+                self._replicas[i] = self._start(i)
+        command = self._config.command or self._config.python_entry
+        replicas = f' x{len(self._replicas)}' if len(self._replicas) > 1 else ''
+        self._prompter.procsay(self._config.name, f'Started: `{command}`{replicas}')
 
     def on_change(self, event: FileSystemEvent):
         self._prompter.procsay(self._config.name, f'Restarting...')
-        self._stop()
-        self._start()
-        return ProcessorResult(success=True, message="Restarted!")
+        indices = list(range(len(self._replicas)))
+        size = self._config.rolling_batch
+        stop_time = start_time = 0.0
+
+        # Roll the replicas in batches so the others keep serving
+        for batch in [indices[i : i + size] for i in range(0, len(indices), size)]:
+            if self._config.restart_strategy == 'start-first':
+                # Keep the old processes serving until the new ones get ready
+                started = time.monotonic()
+                instances = [self._start(i) for i in batch]
+                ready = all([self._probe.wait(instance) for instance in instances])
+                start_time += time.monotonic() - started
+                if not ready:
+                    self._stop(instances)
+                    return ProcessorResult(
+                        success=False, message=self._not_ready(batch, 'kept the old process')
+                    )
+
+                stop_time += self._stop(self._swap(batch, instances))
+            else:
+                stop_time += self._stop(self._swap(batch, [None] * len(batch)))
+                started = time.monotonic()
+                instances = self._replace(batch)
+                ready = all([self._probe.wait(instance) for instance in instances])
+                start_time += time.monotonic() - started
+                if not ready:
+                    return ProcessorResult(
+                        success=False, message=self._not_ready(batch, 'restarted')
+                    )
+            self.restarts += len(batch)
+
+        times = f'stop: {self._duration(stop_time)}, start: {self._duration(start_time)}'
+        return ProcessorResult(success=True, message=f'Restarted! ({times})')
 
     def close(self):
-        self._stop()
+        self._stop(self._detach())
+        if self._server:
+            self._server.stop()
+            self._server = None
+        self._prompter.procsay(self._config.name, f'Stopped!')
+
+    async def on_change_batch_async(self, events: List[FileSystemEvent]):
+        # on_change that awaits the readiness and the exits instead of blocking a thread
+        self._prompter.procsay(self._config.name, f'Restarting...')
+        loop = asyncio.get_running_loop()
+        indices = list(range(len(self._replicas)))
+        size = self._config.rolling_batch
+        stop_time = start_time = 0.0
+
+        for batch in [indices[i : i + size] for i in range(0, len(indices), size)]:
+            if self._config.restart_strategy == 'start-first':
+                started = time.monotonic()
+                instances = [await loop.run_in_executor(None, self._start, i) for i in batch]
+                try:
+                    probes = [self._probe.wait_async(instance) for instance in instances]
+                    ready = all(await asyncio.gather(*probes))
+                except asyncio.CancelledError:
+                    await self._stop_async(instances)
+                    raise
+                start_time += time.monotonic() - started
+                if not ready:
+                    await self._stop_async(instances)
+                    return ProcessorResult(
+                        success=False, message=self._not_ready(batch, 'kept the old process')
+                    )
+
+                stop_time += await self._stop_async(self._swap(batch, instances))
+            else:
+                stop_time += await self._stop_async(self._swap(batch, [None] * len(batch)))
+                started = time.monotonic()
+                instances = await loop.run_in_executor(None, self._replace, batch)
+                probes = [self._probe.wait_async(instance) for instance in instances]
+                ready = all(await asyncio.gather(*probes))
+                start_time += time.monotonic() - started
+                if not ready:
+                    return ProcessorResult(
+                        success=False, message=self._not_ready(batch, 'restarted')
+                    )
+            self.restarts += len(batch)
+
+        times = f'stop: {self._duration(stop_time)}, start: {self._duration(start_time)}'
+        return ProcessorResult(success=True, message=f'Restarted! ({times})')
+
+    async def close_async(self):
+        await self._stop_async(self._detach())
+        if self._server:
+            await asyncio.get_running_loop().run_in_executor(None, self._server.stop)
+            self._server = None
         self._prompter.procsay(self._config.name, f'Stopped!')
 
-    def _start(self):
-        stdout = None if self._config.stdout else subprocess.DEVNULL
-        stderr = None if self._config.stderr else subprocess.DEVNULL
-        # Thanks to: https://stackoverflow.com/a/22582602/2735798
-        self._child_process = Popen(
+    def _swap(self, batch, instances):
+        # Put the instances in place of the batch, and returns the old ones
+        with self._lock:
+            old = [self._replicas[i] for i in batch]
+            for i, instance in zip(batch, instances):
+                self._replicas[i] = instance
+        return old
+
+    def _replace(self, batch):
+        # Start new instances in place of the batch; the lock lets the supervision see them
+        with self._lock:
+            for i in batch:
+                self._replicas[i] = self._start(i)
+            return [self._replicas[i] for i in batch]
+
+    def _detach(self):
+        # Stop the supervision, and returns all instances to stop
+        with self._lock:
+            self._closing = True
+            for timer in self._revive_timers.values():
+                timer.cancel()
+            old, self._replicas = self._replicas, [None] * len(self._replicas)
+        return old
+
+    def _start(self, index):
+        self._probe.prepare()
+        env = dict(self._config.environment or dict(), R3_REPLICA_INDEX=str(index))
+        if self._server:
+            self._refresh_template()
+            proc = self._server.spawn(
+                self._config.python_entry, env=env, quiet=not self._config.stdout
+            )
+            return DaemonInstance(proc, on_exit=self._on_exit)
+
+        return DaemonInstance.popen(
             self._config.command,
-            shell=True,
-            stdout=stdout,
-            stderr=stderr,
-            preexec_fn=os.setsid,
+            env=dict(os.environ, **env),
+            stdout=self._config.stdout,
+            stderr=self._config.stderr,
+            pattern=self._probe.pattern,
+            on_exit=self._on_exit,
         )
 
-    def _stop(self):
-        if self._child_process is None:
-            return
+    def _not_ready(self, batch, action):
+        if len(self._replicas) == 1:
+            return f'Not ready, {action}'
+        return f'Replicas {", ".join(map(str, batch))} not ready, {action}'
 
-        for duration in self._backoff(self._config.timeout):
-            # Graceful
-            os.killpg(os.getpgid(self._child_process.pid), self._signal)
-            self._fire_and_forget()
-            if self._child_process.poll() is not None:
-                break
-            time.sleep(duration)
-        else:
-            # You have been terminated
-            self._fire_and_forget(sig=signal.SIGKILL)
-        self._child_process = None
+    def _start_template(self):
+        # Children import the package of the entry freshly
+        package = self._config.python_entry.partition(':')[0].split('.')[0]
+        self._server = ForkServer(preload=self._config.preload, purge=[package])
+        self._server.start()
+
+        # Changes of preloaded files outside the project make the template stale
+        project = os.path.abspath(self._config.path) + os.sep
+        self._stamps = dict()
+        for file in self._server.preloaded_files:
+            if not os.path.abspath(file).startswith(project):
+                try:
+                    self._stamps[file] = os.stat(file).st_mtime_ns
+                except OSError:
+                    pass
+        self._prompter.procsay(
+            self._config.name,
+            f'Template is ready ({len(self._server.preloaded_files)} modules preloaded)',
+        )
+
+    def _refresh_template(self):
+        stale = []
+        for file, mtime in self._stamps.items():
+            try:
+                if os.stat(file).st_mtime_ns != mtime:
+                    stale.append(file)
+            except OSError:
+                stale.append(file)
+        if stale:
+            self._prompter.procsay(
+                self._config.name, f'Rebuilding the template ({len(stale)} preloaded files changed)'
+            )
+            # The old template retires after the processes forked from it have been stopped
+            self._server.stop()
+            self._start_template()
+
+    def _on_exit(self, instance: DaemonInstance):
+        # Called by the thread waiting for the instance; it's a crash unless it was stopped
+        with self._lock:
+            if instance.stopping or instance not in self._replicas:
+                return
+            index = self._replicas.index(instance)
+            name = self._config.name
+            if len(self._replicas) > 1:
+                name = f'{name}[{index}]'
+
+            self.crashes += 1
+            code = instance.poll()
+            reason = f'code {code}' if code >= 0 else self._signal_name(-code)
+            self._prompter.procerr(
+                name,
+                f'Exited with {reason} after {self._duration(instance.uptime)} '
+                f'(crashes: {self.crashes}, restarts: {self.restarts})',
+            )
 
-    def _fire_and_forget(self, sig=None):
-        if sig is None:
-            sig = self._signal
+            policy = self._config.restart_policy
+            if self._closing or policy == 'no' or (policy == 'on-failure' and code == 0):
+                return
+
+            # Back off exponentially while it keeps crashing soon after starting
+            if instance.uptime >= self._config.restart_delay_max:
+                self._streaks[index] = 0
+            delay = self._config.restart_delay * 2 ** self._streaks[index]
+            delay = min(delay, self._config.restart_delay_max)
+            self._streaks[index] += 1
+            self._prompter.procsay(name, f'Restarting in {self._duration(delay)}...')
+            timer = threading.Timer(delay, self._revive, (index, instance))
+            timer.daemon = True
+            timer.start()
+            self._revive_timers[index] = timer
+
+    def _revive(self, index, crashed: DaemonInstance):
+        with self._lock:
+            # Skip if an event has restarted it in the meantime
+            if self._closing or self._replicas[index] is not crashed:
+                return
+            self._replicas[index] = self._start(index)
+            self.restarts += 1
+        self._prompter.procsay(self._config.name, f'Restarted after the crash')
+
+    def _stop(self, instances: List[Optional[DaemonInstance]]):
+        # Returns how long it took to stop the instances
+        started = time.monotonic()
+        stop_all([i for i in instances if i is not None], self._signal, self._config.timeout)
+        return time.monotonic() - started
+
+    async def _stop_async(self, instances: List[Optional[DaemonInstance]]):
+        started = time.monotonic()
+        instances = [i for i in instances if i is not None]
+        await stop_all_async(instances, self._signal, self._config.timeout)
+        return time.monotonic() - started
+
+    @staticmethod
+    def _signal_name(signum):
+        # Real-time signals don't have names
         try:
-            os.killpg(os.getpgid(self._child_process.pid), sig)
-        except Exception:
-            pass
+            return f'signal {signal.Signals(signum).name}'
+        except ValueError:
+            return f'signal {signum}'
+
+    @staticmethod
+    def _duration(seconds):
+        if seconds < 1:
+            return f'{seconds * 1000:.0f}ms'
+        if seconds < 60:
+            return f'{seconds:.2f}s'
+        return str(timedelta(seconds=int(seconds)))
+
+
+class PythonProcessor(Processor):
+    id = 'python'
+    mendatory_keys = {'function'}
+    optional_keys = {'batch', 'pool', 'workers'}
+
+    _config: PythonProcessorConfig
+
+    _function: Optional[Callable] = None
+    _pool: Optional[Executor] = None
+
+    def __init__(self, root_config, job_config: PythonProcessorConfig, prompter):
+        super().__init__(root_config, job_config, prompter)
+        if ':' not in job_config.function:
+            raise ValueError(f'Specify the function as "module:function": "{job_config.function}"')
+        if job_config.pool not in ('', 'thread', 'process'):
+            raise ValueError(f'Unknown pool: "{job_config.pool}"')
+
+    def open(self):
+        self._function = _resolve_function(self._config.function)
+        workers = self._config.workers or cpu_count()
+        if self._config.pool == 'thread':
+            self._pool = ThreadPoolExecutor(workers, thread_name_prefix=f'r3build-{self.id}')
+        elif self._config.pool == 'process':
+            # Workers import the function by themselves; forking a threaded process isn't safe
+            self._pool = ProcessPoolExecutor(workers, mp_context=get_context('spawn'))
+
+    def on_change(self, event: FileSystemEvent):
+        return self.on_change_batch([event])
+
+    def on_change_batch(self, events: List[FileSystemEvent]):
+        arg = list(events) if self._config.batch else events[-1]
+        if self._pool is None:
+            return self._result(self._function(arg))
+        return self._result(self._submit(arg).result())
+
+    async def on_change_batch_async(self, events: List[FileSystemEvent]):
+        if self._pool is None:
+            return await super().on_change_batch_async(events)
+        arg = list(events) if self._config.batch else events[-1]
+        return self._result(await asyncio.wrap_future(self._submit(arg)))
+
+    def close(self):
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _submit(self, arg):
+        if isinstance(self._pool, ProcessPoolExecutor):
+            return self._pool.submit(_call_function, self._config.function, arg)
+        return self._pool.submit(self._function, arg)
 
     @staticmethod
-    def _backoff(timeout):
-        class Backoff:
-            def __init__(self, d, timeout):
-                self.d, self.timeout = d, timeout
-                self.acc, self.stop = 0, False
+    def _result(ret):
+        if ret is False or (isinstance(ret, int) and not isinstance(ret, bool) and ret != 0):
+            return ProcessorResult(success=False)
+        return ProcessorResult(success=True)
+
+
+def _resolve_function(target) -> Callable:
+    """Import a function by the path of "package.module:function"."""
+    module, _, name = target.partition(':')
+    obj = importlib.import_module(module)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+_functions: Dict[str, Callable] = dict()  # cache of workers of PythonProcessor
+
 
-            def __iter__(self):
-                return self
+def _call_function(target, arg):
+    # Runs in a worker process
+    if target not in _functions:
+        _functions[target] = _resolve_function(target)
+    return _functions[target](arg)
 
-            def __next__(self):
-                if self.stop:
-                    raise StopIteration
 
-                if self.acc + self.d > self.timeout:
-                    self.stop = True
-                    return self.timeout - self.acc
+class SyncProcessor(Processor):
+    id = 'sync'
+    mendatory_keys = {'destination'}
+    optional_keys = {'delete'}
 
-                ret = self.d
-                self.acc += self.d
-                self.d *= 2
-                return ret
+    _config: SyncProcessorConfig
+    _mirror: Mirror
 
-        return Backoff(0.1, timeout)
+    def __init__(self, root_config, job_config: SyncProcessorConfig, prompter):
+        super().__init__(root_config, job_config, prompter)
+        self._mirror = Mirror(job_config.path, job_config.destination, job_config.delete)
+
+    def on_change(self, event: FileSystemEvent):
+        return self.on_change_batch([event])
+
+    def on_change_batch(self, events: List[FileSystemEvent]):
+        self._mirror.apply(events)
+        return ProcessorResult(success=True, message=self._mirror.summary())
 
 
 class InternaltestProcessor(Processor):
@@ -246,12 +1139,19 @@ class InternaltestProcessor(Processor):
         print(f'<{name}>  event: {event.event_type}, path: {event.src_path}')
         return ProcessorResult(success=True)
 
+    def on_change_batch(self, events: List[FileSystemEvent]):
+        for event in events:
+            self.on_change(event)
+        return ProcessorResult(success=True)
+
 
 p = [
     MakeProcessor,
     PytestProcessor,
     CommandProcessor,
     DaemonProcessor,
+    PythonProcessor,
+    SyncProcessor,
     InternaltestProcessor,
 ]
 
@@ -0,0 +1,115 @@
+import asyncio
+import os
+
+from watchdog.events import FileDeletedEvent, FileModifiedEvent
+
+from r3build.cli import R3build
+from r3build.processor import Processor
+
+
+def test_argv():
+    assert Processor._helper_argv('make -j4 -C "a dir" all') == (
+        'make',
+        '-j4',
+        '-C',
+        'a dir',
+        'all',
+    )
+    for cmd in ['echo $HOME', 'a && b', 'ls *.py', 'cd foo', 'FOO=1 make', 'a > b', 'echo ~']:
+        assert Processor._helper_argv(cmd) == ('/bin/sh', '-c', cmd)
+
+
+def test_env_per_run(tmp_path):
+    job = {
+        'name': 'command',
+        'type': 'command',
+        'path': str(tmp_path),
+        'command': f'sh -c \'echo "$R3_FILENAME $FOO" > {tmp_path / "out"}\'',
+        'environment': {'FOO': 'bar'},
+    }
+    r3 = R3build(config_dict={'job': [job]})
+    processor = r3.get_job('command').processor
+    environ = dict(os.environ)
+
+    for name in ['a.txt', 'b.txt']:
+        assert processor.on_change(FileModifiedEvent(str(tmp_path / name))).success
+        assert (tmp_path / 'out').read_text() == f'{tmp_path / name} bar\n'
+    assert dict(os.environ) == environ
+
+
+def test_files_placeholder(tmp_path):
+    out = tmp_path / 'out'
+    job = {
+        'name': 'command',
+        'type': 'command',
+        'path': str(tmp_path),
+        'command': f'sh -c \'echo "$@" >> {out}; test $# -eq 2\' sh {{files}}',
+        'files_chunk_size': 2,
+        'files_parallel': 2,
+    }
+    r3 = R3build(config_dict={'job': [job]})
+    processor = r3.get_job('command').processor
+
+    paths = [str(tmp_path / f'{i} x.txt') for i in range(4)]
+    events = [FileModifiedEvent(p) for p in paths] + [FileDeletedEvent(str(tmp_path / 'gone'))]
+    assert processor.on_change_batch(events).success
+    lines = sorted(out.read_text().splitlines())
+    assert lines == [f'{paths[0]} {paths[1]}', f'{paths[2]} {paths[3]}']
+
+    # The last chunk has only one path
+    result = processor.on_change_batch(events[:3])
+    assert not result.success
+    assert result.message == '1/2 chunks failed (exit codes: 0, 1)'
+
+    # Without shell syntax, paths are passed as arguments as they are
+    processor._config.command = 'lint --fix {files}'
+    assert processor._commands(events[:3], {}) == [
+        ('lint', '--fix', paths[0], paths[1]),
+        ('lint', '--fix', paths[2]),
+    ]
+
+
+def test_python_function(tmp_path, monkeypatch):
+    (tmp_path / 'hooks.py').write_text(
+        'import os\n'
+        'def on_change(event):\n'
+        '    return 0 if os.path.basename(event.src_path) != "bad" else 1\n'
+        'def on_batch(events):\n'
+        '    return [os.path.basename(e.src_path) for e in events] == ["a", "b"]\n'
+    )
+    # Spawned workers of the process pool import the module by themselves
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+
+    for pool in ['', 'thread', 'process']:
+        job = {'name': 'python', 'type': 'python', 'path': str(tmp_path), 'pool': pool}
+        r3 = R3build(config_dict={'job': [dict(job, function='hooks:on_change')]})
+        processor = r3.get_job('python').processor
+        processor.open()
+        assert processor.on_change(FileModifiedEvent(str(tmp_path / 'a'))).success
+        # Only the last event is passed without batch
+        events = [FileModifiedEvent(str(tmp_path / 'a')), FileModifiedEvent(str(tmp_path / 'bad'))]
+        assert not processor.on_change_batch(events).success
+        processor.close()
+
+        job.update(function='hooks:on_batch', batch=True, workers=1)
+        r3 = R3build(config_dict={'job': [job]})
+        processor = r3.get_job('python').processor
+        processor.open()
+        events = [FileModifiedEvent(str(tmp_path / n)) for n in 'ab']
+        assert processor.on_change_batch(events).success
+        assert not processor.on_change_batch(events[:1]).success
+        processor.close()
+
+
+def test_command_not_found(tmp_path):
+    script = tmp_path / 'script'
+    script.write_text('#!/bin/sh\n')
+    job = {'name': 'command', 'type': 'command', 'path': str(tmp_path)}
+    r3 = R3build(config_dict={'job': [dict(job, command='r3build-no-such-command --flag')]})
+    processor = r3.get_job('command').processor
+
+    assert processor._helper_run(('r3build-no-such-command',)).returncode == 127
+    assert processor._helper_run((str(script),)).returncode == 126
+    assert asyncio.run(processor._helper_run_async(('r3build-no-such-command',))) == 127
+    assert not processor.on_change(FileModifiedEvent(str(tmp_path / 'a.txt'))).success
@@ -30,6 +30,15 @@ class Prompter:
             f"R3BUILD {name} >> Detected '{event.event_type}' event on {event.src_path}", "green"
         )
 
+    def trigger_batch(self, name, events):
+        name = self.ellipsify(name)
+        last = events[-1]
+        cprint(
+            f"R3BUILD {name} >> Detected {len(events)} events "
+            f"(last: '{last.event_type}' event on {last.src_path})",
+            "green",
+        )
+
     def result(self, name, info, color):
         name = self.ellipsify(name)
         cprint(f"R3BUILD {name} >> {info}", color)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path, PurePath
+from typing import Dict, List
+
+_magic = frozenset('*?[')
+
+
+class _Node:
+    __slots__ = ('children', 'jobs')
+
+    def __init__(self):
+        self.children: Dict[str, _Node] = dict()
+        self.jobs: List[int] = []
+
+
+class Router:
+    """Path-prefix routing index of jobs.
+
+    Router maps an event path to the candidate jobs that could accept it,
+    so the dispatcher doesn't have to run the filters of all jobs.
+
+    It's a trie over path components. A job is registered at the literal
+    (wildcard-free) prefixes of its glob patterns, or at its absolute path
+    if it doesn't have any glob pattern. A job is a candidate for a path if
+    it's registered at the path or any of its ancestors.
+    """
+
+    def __init__(self, jobs):
+        self._jobs = list(jobs)
+        self._root = _Node()
+        for i, job in enumerate(self._jobs):
+            for prefix in self.prefixes(job):
+                self._insert(prefix, i)
+
+    @staticmethod
+    def prefixes(job):
+        patterns = job.matcher.glob_patterns
+        if not patterns:
+            path = str(Path(job.path).absolute())
+            return {path, os.path.realpath(path)}
+
+        prefixes = set()
+        for pattern in patterns:
+            parts = []
+            for part in PurePath(pattern).parts:
+                if _magic.intersection(part):
+                    break
+                parts.append(part)
+            prefixes.add(str(PurePath(*parts)))
+        return prefixes
+
+    def _insert(self, prefix, i):
+        node = self._root
+        for part in prefix.rstrip(os.sep).split(os.sep):
+            node = node.children.setdefault(part, _Node())
+        if i not in node.jobs:
+            node.jobs.append(i)
+
+    def route(self, abspath) -> list:
+        """Returns candidate jobs for the normalized path, in the config order.
+
+        Both of the registered prefixes and the path are normalized by pathlib,
+        so splitting them by the separator yields the same components.
+        """
+        node = self._root
+        found = list(node.jobs)
+        for part in abspath.split(os.sep):
+            node = node.children.get(part)
+            if node is None:
+                break
+            found.extend(node.jobs)
+        return [self._jobs[i] for i in sorted(set(found))]
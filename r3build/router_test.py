@@ -0,0 +1,21 @@
+from r3build.cli import R3build
+
+
+def test_route():
+    jobs = [
+        {'name': 'c', 'type': 'internaltest', 'path': '/repo', 'glob': ['src/*.c', 'inc/**/*.h']},
+        {'name': 'py', 'type': 'internaltest', 'path': '/repo/py'},
+        {'name': 'all', 'type': 'internaltest', 'path': '/repo', 'glob': '*.toml'},
+        {'name': 'docs', 'type': 'internaltest', 'path': '/docs', 'regex': r'.+\.md$'},
+    ]
+    r3 = R3build(config_dict={'job': jobs})
+
+    def names(path):
+        return [job.name for job in r3.router.route(path)]
+
+    assert names('/repo/src/a.c') == ['c', 'all']
+    assert names('/repo/inc/x/a.h') == ['c', 'all']
+    assert names('/repo/py/a.py') == ['py', 'all']
+    assert names('/repo/a.toml') == ['all']
+    assert names('/docs/a.md') == ['docs']
+    assert names('/elsewhere/a.c') == []
@@ -0,0 +1,79 @@
+"""Sharding of pytest sessions across worker processes.
+
+The module is also a pytest plugin (`-p r3build.shard`) that talks with
+PytestProcessor through files named in environment variables:
+
+- R3_PYTEST_COLLECT: the plugin writes collected node IDs into it, one per line.
+- R3_PYTEST_SHARD: the plugin deselects items whose node IDs are not listed in it.
+- R3_PYTEST_DURATIONS: the plugin writes the durations of the tests as JSON.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import os
+from typing import Dict, List
+
+
+def split(items: List[str], workers: int, durations: Dict[str, float]) -> List[List[str]]:
+    """Split node IDs into at most `workers` shards with similar total durations.
+
+    Items without history are assumed to take the average duration.
+    Each shard keeps the collection order so module and class fixtures are shared.
+    """
+    workers = max(min(workers, len(items)), 1)
+    known = [durations[i] for i in items if i in durations]
+    default = sum(known) / len(known) if known else 1.0
+
+    order = {item: i for i, item in enumerate(items)}
+    heaviest = sorted(items, key=lambda i: durations.get(i, default), reverse=True)
+    shards = [[] for _ in range(workers)]
+    loads = [(0.0, i) for i in range(workers)]
+    for item in heaviest:
+        load, i = heapq.heappop(loads)
+        shards[i].append(item)
+        heapq.heappush(loads, (load + durations.get(item, default), i))
+
+    return [sorted(s, key=order.__getitem__) for s in shards if s]
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+"""pytest hooks"""
+
+_durations: Dict[str, float] = dict()
+
+
+def pytest_collection_modifyitems(config, items):
+    path = os.environ.get('R3_PYTEST_SHARD')
+    if not path:
+        return
+    shard = set(read_lines(path))
+    selected = [item for item in items if item.nodeid in shard]
+    deselected = [item for item in items if item.nodeid not in shard]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+    items[:] = selected
+
+
+def pytest_collection_finish(session):
+    path = os.environ.get('R3_PYTEST_COLLECT')
+    if path:
+        with open(path, 'w') as f:
+            f.write(''.join(f'{item.nodeid}\n' for item in session.items))
+
+
+def pytest_runtest_logreport(report):
+    # Sum up setup, call and teardown
+    _durations[report.nodeid] = _durations.get(report.nodeid, 0.0) + report.duration
+
+
+def pytest_sessionfinish(session):
+    path = os.environ.get('R3_PYTEST_DURATIONS')
+    if path:
+        with open(path, 'w') as f:
+            json.dump(_durations, f)
@@ -0,0 +1,38 @@
+from watchdog.events import FileModifiedEvent
+
+from r3build.cli import R3build
+from r3build.shard import split
+
+
+def test_split():
+    items = ['a', 'b', 'c', 'd', 'e']
+    durations = {'a': 4.0, 'b': 1.0, 'c': 3.0, 'd': 2.0}
+
+    shards = split(items, 2, durations)
+    assert sorted(sum(durations.get(i, 2.5) for i in s) for s in shards) == [6.0, 6.5]
+    # Shards keep the collection order
+    assert all(s == sorted(s) for s in shards)
+
+    assert split(items, 8, {}) == [[i] for i in items]
+    assert split([], 4, {}) == []
+
+
+def test_pytest_workers(tmp_path):
+    for i in range(3):
+        test = tmp_path / f'sharded{i}_test.py'
+        test.write_text(f'def test_foo():\n    assert {i} != 2\n\ndef test_bar():\n    pass\n')
+
+    job = {'name': 'sharded', 'type': 'pytest', 'target': str(tmp_path), 'workers': 2}
+    r3 = R3build(config_dict={'job': [job], 'log': {'job_output': False}})
+    processor = r3.get_job('sharded').processor
+    processor.open()
+    try:
+        event = FileModifiedEvent(str(tmp_path / 'sharded0_test.py'))
+        result = processor.on_change(event)
+        assert not result.success
+        assert len(processor._durations) == 6
+
+        (tmp_path / 'sharded2_test.py').write_text('def test_foo():\n    pass\n')
+        assert processor.on_change(event).success
+    finally:
+        processor.close()
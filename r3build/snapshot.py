@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent, FileSystemEvent
+
+
+class Entry(NamedTuple):
+    mtime_ns: int
+    size: int
+    hash: Optional[bytes]
+
+
+class Snapshot:
+    """Persistent snapshot of the watched trees.
+
+    It's saved in a SQLite file on shutdown and compared with the trees on
+    startup, to catch up with the changes made while r3build was down.
+
+    Trees are walked with os.scandir in parallel. If `use_hash` is set,
+    files whose mtime or size differ are hashed to tell if the content has
+    really changed. Files with the same stat are never rehashed; their hash
+    is carried over from the previous snapshot.
+    """
+
+    path: str
+    roots: List[str]
+    use_hash: bool
+    entries: Dict[str, Entry]  # the latest known state of the trees
+
+    chunk_size = 1 << 20
+
+    def __init__(self, path, roots: Iterable[str], use_hash=False, workers=8):
+        self.path = str(Path(path).absolute())
+        self.roots = self._outermost(str(Path(r).absolute()) for r in roots)
+        self.use_hash = use_hash
+        self.workers = workers
+        self.entries = dict()
+
+    @staticmethod
+    def _outermost(roots):
+        # Remove roots that are inside another root
+        result = []
+        for root in sorted(set(roots)):
+            if not any(root == r or root.startswith(r.rstrip(os.sep) + os.sep) for r in result):
+                result.append(root)
+        return result
+
+    def load(self) -> Dict[str, Entry]:
+        """Load the saved snapshot. Returns an empty dict if it doesn't exist."""
+        if not os.path.exists(self.path):
+            return dict()
+        with closing(sqlite3.connect(self.path)) as db:
+            self._create_table(db)
+            rows = db.execute('SELECT path, mtime_ns, size, hash FROM files')
+            return {row[0]: Entry(*row[1:]) for row in rows}
+
+    def save(self):
+        """Scan the trees and save them, reusing known hashes of unchanged files."""
+        entries = self.scan(known=self.entries)
+        with closing(sqlite3.connect(self.path)) as db, db:
+            self._create_table(db)
+            db.execute('DELETE FROM files')
+            db.executemany(
+                'INSERT INTO files VALUES (?, ?, ?, ?)',
+                ((p, e.mtime_ns, e.size, e.hash) for p, e in entries.items()),
+            )
+        self.entries = entries
+
+    def catch_up(self) -> List[FileSystemEvent]:
+        """Compare the saved snapshot with the trees and returns synthetic events for the differences."""
+        old = {p: e for p, e in self.load().items() if self._is_watched(p)}
+        new = self.scan(known=old)
+        self.entries = new
+
+        events = []
+        for path, entry in new.items():
+            prev = old.get(path)
+            if prev is None:
+                events.append(FileCreatedEvent(path, is_synthetic=True))
+            elif (prev.mtime_ns, prev.size) != (entry.mtime_ns, entry.size):
+                if entry.hash is None or prev.hash is None or entry.hash != prev.hash:
+                    events.append(FileModifiedEvent(path, is_synthetic=True))
+        for path in old.keys() - new.keys():
+            events.append(FileDeletedEvent(path, is_synthetic=True))
+        return events
+
+    def scan(self, known: Dict[str, Entry] = None) -> Dict[str, Entry]:
+        """Walk the trees in parallel and returns their entries.
+
+        The hash of a file is taken from `known` if the stat is the same, or computed if use_hash is set.
+        """
+        known = known or dict()
+        stats = dict()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._scan_dir, root) for root in self.roots}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, dirs = future.result()
+                    stats.update(files)
+                    for path in [p for p in files if p.startswith(self.path)]:
+                        del stats[path]  # the snapshot itself and its journal
+                    futures |= {pool.submit(self._scan_dir, d) for d in dirs}
+
+            entries = dict()
+            to_hash = []
+            for path, (mtime_ns, size) in stats.items():
+                prev = known.get(path)
+                if prev is not None and (prev.mtime_ns, prev.size) == (mtime_ns, size):
+                    entries[path] = Entry(mtime_ns, size, prev.hash)
+                else:
+                    entries[path] = Entry(mtime_ns, size, None)
+                    to_hash.append(path)
+
+            if self.use_hash:
+                for path, digest in zip(to_hash, pool.map(self._hash, to_hash)):
+                    entries[path] = entries[path]._replace(hash=digest)
+
+        return entries
+
+    @staticmethod
+    def _scan_dir(path):
+        files, dirs = dict(), []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            files[entry.path] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return files, dirs
+
+    def _hash(self, path):
+        h = hashlib.blake2b(digest_size=16)
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+        except OSError:
+            return None
+        return h.digest()
+
+    def _is_watched(self, path):
+        return any(path.startswith(r.rstrip(os.sep) + os.sep) for r in self.roots)
+
+    @staticmethod
+    def _create_table(db):
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS files '
+            '(path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash BLOB) WITHOUT ROWID'
+        )
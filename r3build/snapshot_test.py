@@ -0,0 +1,37 @@
+import os
+
+from r3build.snapshot import Snapshot
+
+
+def test_catch_up(tmp_path):
+    tree = tmp_path / 'tree'
+    (tree / 'sub').mkdir(parents=True)
+    (tree / 'keep.txt').write_text('keep')
+    (tree / 'touch.txt').write_text('touch')
+    (tree / 'edit.txt').write_text('edit')
+    (tree / 'sub' / 'delete.txt').write_text('delete')
+
+    db = str(tmp_path / 'snapshot.db')
+    Snapshot(db, [str(tree)], use_hash=True).save()
+
+    # Changes made while r3build was down
+    st = (tree / 'touch.txt').stat()
+    os.utime(tree / 'touch.txt', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    (tree / 'edit.txt').write_text('edited')
+    (tree / 'sub' / 'delete.txt').unlink()
+    (tree / 'sub' / 'create.txt').write_text('create')
+
+    snapshot = Snapshot(db, [str(tree), str(tree / 'sub')], use_hash=True)
+    events = {(e.event_type, os.path.relpath(e.src_path, tree)) for e in snapshot.catch_up()}
+    assert events == {
+        ('modified', 'edit.txt'),
+        ('deleted', 'sub/delete.txt'),
+        ('created', 'sub/create.txt'),
+    }
+
+    # Without hashes, a new mtime is a modification
+    snapshot = Snapshot(db, [str(tree)])
+    snapshot.save()
+    os.utime(tree / 'keep.txt', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    events = {(e.event_type, os.path.relpath(e.src_path, tree)) for e in snapshot.catch_up()}
+    assert events == {('modified', 'keep.txt')}
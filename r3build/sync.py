@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+from typing import Dict, Iterable, Optional, Set
+
+from watchdog.events import FileSystemEvent
+
+# Errors that mean the kernel can't offload the copy between these files
+_unsupported = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def copy_file(src, dst):
+    """Copy the content of `src` to `dst` without passing it through user space.
+
+    It tries copy_file_range(), which lets the filesystem share the extents (reflink),
+    then sendfile(), and falls back to a plain read/write loop.
+    The file is written next to `dst` and renamed, so readers never see a partial file.
+    """
+    tmp = os.path.join(os.path.dirname(dst), f'.{os.path.basename(dst)}.r3sync')
+    with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        for copy in (_copy_file_range, _sendfile):
+            try:
+                if copy(fsrc.fileno(), fdst.fileno(), size):
+                    break
+            except OSError as e:
+                if e.errno not in _unsupported:
+                    raise
+            # Start over from the beginning if the copy failed midway
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+        else:
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copystat(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _copy_file_range(fd_in, fd_out, size) -> bool:
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(fd_in, fd_out, size - copied)
+        if n == 0:
+            # The file got shorter while copying it
+            break
+        copied += n
+    return True
+
+
+def _sendfile(fd_in, fd_out, size) -> bool:
+    copied = 0
+    while copied < size:
+        n = os.sendfile(fd_out, fd_in, copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+    os.lseek(fd_out, copied, os.SEEK_SET)
+    return True
+
+
+class Mirror:
+    """Mirrors changes of files under `source` into `destination`.
+
+    Only the paths in the events are touched, so it doesn't scan the trees.
+    A path that changes several times in a batch is copied once, and moves and
+    deletions are applied in the destination without copying the data again.
+    """
+
+    source: str
+    destination: str
+    delete: bool  # mirror deletions
+
+    copied: int
+    moved: int
+    removed: int
+
+    def __init__(self, source, destination, delete=True):
+        self.source = os.path.abspath(source)
+        self.destination = os.path.abspath(destination)
+        self.delete = delete
+        if self._relpath(self.destination) is not None:
+            raise ValueError(f'The destination is inside the source: "{destination}"')
+        self.copied = self.moved = self.removed = 0
+
+    def apply(self, events: Iterable[FileSystemEvent]):
+        """Apply the events in the order they happened."""
+        self.copied = self.moved = self.removed = 0
+        copies: Dict[str, None] = dict()  # relative paths of files to copy, in order
+        mkdirs: Set[str] = set()
+
+        for event in events:
+            rel = self._relpath(event.src_path)
+            if event.event_type == 'moved':
+                dest_rel = self._relpath(event.dest_path)
+                if rel is None and dest_rel is None:
+                    continue
+                if rel is None:
+                    # Moved into the source tree; there's nothing to rename in the mirror
+                    self._add(dest_rel, event.is_directory, copies, mkdirs)
+                elif dest_rel is None:
+                    self._forget(rel, copies, mkdirs)
+                    self._remove(rel)
+                else:
+                    self._rename(rel, dest_rel, event.is_directory, copies, mkdirs)
+            elif rel is None:
+                continue
+            elif event.event_type == 'deleted':
+                self._forget(rel, copies, mkdirs)
+                self._remove(rel)
+            elif event.event_type == 'created':
+                self._add(rel, event.is_directory, copies, mkdirs)
+            elif event.event_type == 'modified' and not event.is_directory:
+                # A directory is modified by every change of its entries, which have their own events
+                copies[rel] = None
+
+        # Create all directories first, so each of them is made only once
+        for rel in copies:
+            mkdirs.add(os.path.dirname(rel))
+        for rel in sorted(mkdirs):
+            os.makedirs(os.path.join(self.destination, rel), exist_ok=True)
+        for rel in copies:
+            try:
+                copy_file(os.path.join(self.source, rel), os.path.join(self.destination, rel))
+            except FileNotFoundError:
+                # Deleted after the event; its deleted event will follow
+                continue
+            self.copied += 1
+
+    def _relpath(self, path) -> Optional[str]:
+        path = os.path.abspath(path)
+        if path == self.source:
+            return ''
+        if not path.startswith(self.source + os.sep):
+            return None
+        return path[len(self.source) + 1 :]
+
+    def _add(self, rel, is_directory, copies, mkdirs):
+        if not is_directory:
+            copies[rel] = None
+        elif rel:
+            mkdirs.add(rel)
+            # Files created or moved in with the directory may not have their own events
+            for root, _, files in os.walk(os.path.join(self.source, rel)):
+                base = os.path.relpath(root, self.source)
+                mkdirs.add(base)
+                copies.update((os.path.join(base, f), None) for f in files)
+
+    def _forget(self, rel, copies, mkdirs):
+        for path in [p for p in copies if _is_under(p, rel)]:
+            del copies[path]
+        mkdirs.difference_update([p for p in mkdirs if _is_under(p, rel)])
+
+    def _rename(self, rel, dest_rel, is_directory, copies, mkdirs):
+        src = os.path.join(self.destination, rel)
+        dst = os.path.join(self.destination, dest_rel)
+        if not os.path.lexists(src):
+            # Not mirrored yet
+            self._forget(rel, copies, mkdirs)
+            self._add(dest_rel, is_directory, copies, mkdirs)
+            return
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        os.replace(src, dst)
+        self.moved += 1
+
+        # Pending copies follow the rename
+        for path in [p for p in copies if _is_under(p, rel)]:
+            del copies[path]
+            copies[dest_rel + path[len(rel) :]] = None
+        for path in [p for p in mkdirs if _is_under(p, rel)]:
+            mkdirs.discard(path)
+            mkdirs.add(dest_rel + path[len(rel) :])
+
+    def _remove(self, rel):
+        if not self.delete or not rel:
+            return
+        path = os.path.join(self.destination, rel)
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+        except FileNotFoundError:
+            return
+        self.removed += 1
+
+    def summary(self) -> str:
+        return f'{self.copied} copied, {self.moved} moved, {self.removed} removed'
+
+
+def _is_under(path, directory) -> bool:
+    return path == directory or path.startswith(directory + os.sep)
@@ -0,0 +1,92 @@
+import os
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirModifiedEvent,
+    DirMovedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
+
+from r3build.cli import R3build
+from r3build.sync import Mirror, copy_file
+
+
+def test_copy_file(tmp_path):
+    src = tmp_path / 'src'
+    src.write_bytes(os.urandom(300000))
+    os.chmod(src, 0o751)
+    copy_file(str(src), str(tmp_path / 'dst'))
+    assert (tmp_path / 'dst').read_bytes() == src.read_bytes()
+    assert os.stat(tmp_path / 'dst').st_mode == os.stat(src).st_mode
+    assert sorted(os.listdir(tmp_path)) == ['dst', 'src']
+
+
+def test_mirror(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    (src / 'a').mkdir(parents=True)
+    (src / 'a' / 'x.txt').write_text('x')
+    (src / 'y.txt').write_text('y')
+    mirror = Mirror(str(src), str(dst))
+
+    mirror.apply(
+        [
+            DirCreatedEvent(str(src / 'a')),
+            FileCreatedEvent(str(src / 'a' / 'x.txt')),
+            FileModifiedEvent(str(src / 'a' / 'x.txt')),
+            FileCreatedEvent(str(src / 'y.txt')),
+            FileModifiedEvent(str(tmp_path / 'outside.txt')),
+        ]
+    )
+    assert mirror.summary() == '2 copied, 0 moved, 0 removed'
+    assert (dst / 'a' / 'x.txt').read_text() == 'x'
+    assert (dst / 'y.txt').read_text() == 'y'
+
+    # Renames are applied to the mirrored files, and pending copies follow them
+    (src / 'a' / 'x.txt').write_text('xx')
+    os.rename(src / 'a', src / 'b')
+    os.rename(src / 'y.txt', src / 'z.txt')
+    mirror.apply(
+        [
+            FileModifiedEvent(str(src / 'a' / 'x.txt')),
+            DirMovedEvent(str(src / 'a'), str(src / 'b')),
+            FileMovedEvent(str(src / 'y.txt'), str(src / 'z.txt')),
+        ]
+    )
+    assert mirror.summary() == '1 copied, 2 moved, 0 removed'
+    assert sorted(os.listdir(dst)) == ['b', 'z.txt']
+    assert (dst / 'b' / 'x.txt').read_text() == 'xx'
+
+    # Saving a file modifies its directory too, which doesn't copy the other files
+    for i in range(5):
+        (src / 'b' / f'{i}.txt').write_text(str(i))
+    mirror.apply([FileModifiedEvent(str(src / 'b' / '0.txt')), DirModifiedEvent(str(src / 'b'))])
+    assert mirror.summary() == '1 copied, 0 moved, 0 removed'
+    assert sorted(os.listdir(dst / 'b')) == ['0.txt', 'x.txt']
+
+    # A file created and deleted in a batch isn't copied
+    (src / 'z.txt').unlink()
+    mirror.apply(
+        [
+            FileCreatedEvent(str(src / 'tmp')),
+            FileDeletedEvent(str(src / 'tmp')),
+            FileDeletedEvent(str(src / 'z.txt')),
+        ]
+    )
+    assert mirror.summary() == '0 copied, 0 moved, 1 removed'
+    assert sorted(os.listdir(dst)) == ['b']
+
+
+def test_sync_job(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    (src / 'a.txt').write_text('a')
+    job = {'name': 'sync', 'type': 'sync', 'path': str(src), 'destination': str(dst)}
+    r3 = R3build(config_dict={'job': [job]})
+    processor = r3.get_job('sync').processor
+
+    result = processor.on_change(FileCreatedEvent(str(src / 'a.txt')))
+    assert result.success and result.message == '1 copied, 0 moved, 0 removed'
+    assert (dst / 'a.txt').read_text() == 'a'
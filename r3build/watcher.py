@@ -2,8 +2,8 @@ from __future__ import annotations
 
 import threading
 import time
-from datetime import datetime
-from typing import Callable, Dict
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
@@ -13,36 +13,103 @@ from r3build.prompter import Prompter
 
 
 class EventBuffer:
-    """Thread-safe event buffer.
+    """Thread-safe, coalescing event buffer.
 
     EventBuffer intends to store pairs of FileSystemEvent and its timestamp.
+    Events are indexed by (src_path, event_type); an event whose key is
+    already buffered is coalesced into the existing one.
+
+    Timestamps are taken from the monotonic clock. As the debounce delay is
+    constant, deadlines come in the order of arrival and a FIFO queue is
+    enough to know which event gets ready first.
     """
 
-    d: Dict[FileSystemEvent, float]
-    mutex: threading.Lock
+    delay: float
+    index: Dict[Tuple[str, str], Tuple[FileSystemEvent, float]]
+    queue: Deque[Tuple[float, Tuple[str, str]]]
+    cond: threading.Condition
+    high_water: int
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.index = dict()
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.high_water = 0
 
-    def __init__(self, *args, **kwargs):
-        self.d = dict(*args, **kwargs)
-        self.mutex = threading.Lock()
+    def __len__(self):
+        with self.cond:
+            return len(self.index)
 
-    def __do(self, fn, *args, **kwargs):
-        self.mutex.acquire()
-        try:
-            return fn(*args, **kwargs)
-        finally:
-            self.mutex.release()
+    def __contains__(self, event):
+        with self.cond:
+            return self.key(event) in self.index
 
-    def events(self):
-        return self.__do(lambda: list(self.d.keys()))
+    @property
+    def size(self):
+        return len(self)
 
-    def items(self):
-        return self.__do(lambda: list(self.d.items()))
+    @staticmethod
+    def key(event):
+        return event.src_path, event.event_type
 
     def push(self, event):
-        self.__do(lambda: self.d.__setitem__(event, datetime.now().timestamp()))
+        """Buffer the event. Returns False if it was coalesced into a buffered one."""
+        key = self.key(event)
+        with self.cond:
+            if key in self.index:
+                return False
+            timestamp = time.monotonic()
+            self.index[key] = (event, timestamp)
+            self.queue.append((timestamp, key))
+            self.high_water = max(self.high_water, len(self.index))
+            self.cond.notify()
+            return True
+
+    def next_deadline(self):
+        """Returns the deadline of the oldest event, or None if it's empty."""
+        with self.cond:
+            return self._next_deadline()
+
+    def drain_ready(self, now):
+        """Pop all events whose deadline is earlier than or equal to `now`."""
+        with self.cond:
+            return self._drain_ready(now)
+
+    def wait_ready(self):
+        """Block until one or more events pass the deadline and pop them.
+
+        The consumer sleeps without a timeout while the buffer is empty and
+        otherwise wakes up exactly when the oldest event passes the delay.
+        """
+        with self.cond:
+            while True:
+                deadline = self._next_deadline()
+                if deadline is None:
+                    self.cond.wait()
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
 
-    def pop(self, event):
-        self.__do(lambda: self.d.pop(event))
+                ready = self._drain_ready(time.monotonic())
+                if ready:
+                    return ready
+
+    def _next_deadline(self):
+        if not self.queue:
+            return None
+        return self.queue[0][0] + self.delay
+
+    def _drain_ready(self, now):
+        ready = []
+        while self.queue and self.queue[0][0] + self.delay <= now:
+            timestamp, key = self.queue.popleft()
+            event, _ = self.index.pop(key)
+            ready.append((event, timestamp))
+        return ready
 
 
 class Watcher(FileSystemEventHandler, threading.Thread):
@@ -52,8 +119,8 @@ class Watcher(FileSystemEventHandler, threading.Thread):
     remove duplicates in short term (~10ms) to make it easy
     to handle events in later stage.
 
-    That being said, this does not have to be asynchronous.
-    We are looking forward to refactor it.
+    The main loop is driven by deadlines rather than polling;
+    it only wakes up when a buffered event is ready to be dispatched.
     """
 
     config: Config
@@ -62,7 +129,8 @@ class Watcher(FileSystemEventHandler, threading.Thread):
     observer: Observer
     has_path: bool
     event_buffer: EventBuffer
-    _callback: Callable[[FileSystemEvent], bool]  # returns if the event was launched
+    # Takes pairs of an event and its timestamp, and returns if any of them was accepted
+    _callback: Callable[[List[Tuple[FileSystemEvent, float]]], bool]
 
     def __init__(self, config, prompter: Prompter):
         FileSystemEventHandler.__init__(self)
@@ -72,7 +140,7 @@ class Watcher(FileSystemEventHandler, threading.Thread):
         self.prompter = prompter
         self.observer = Observer()
         self.has_path = False
-        self.event_buffer = EventBuffer()
+        self.event_buffer = EventBuffer(config.event.rate_limit_duration)
         self._callback = None
 
     def add_path(self, path):
@@ -93,43 +161,36 @@ class Watcher(FileSystemEventHandler, threading.Thread):
         """Watcher's main loop.
 
         It consumes incoming events in buffer. The events won't be consumed
-        if they are too fresh (~10ms).
+        if they are too fresh (~10ms). The loop sleeps until the oldest event
+        in the buffer becomes ready, or until a new event comes in.
         """
 
         if not self._callback:
             raise RuntimeError('Set callback before starting watcher')
 
         self.observer.start()
-        last = datetime.now().timestamp()
 
         while True:
-            for event, timestamp in self.event_buffer.items():
-                elapsed = datetime.now().timestamp() - timestamp
-                if elapsed <= self.config.event.rate_limit_duration:
-                    continue
-                elif self.config.event.ignore_events_while_run and timestamp < last:
-                    if self.config.log.ignored_events:  # TODO: change to ignored_events
-                        self.prompter.ignore("Watcher", "overlapped", event)
-                    self.event_buffer.pop(event)
-                    continue
-                self.event_buffer.pop(event)
-                launched = self._callback(event)
-                if launched:
-                    last = datetime.now().timestamp()
-            time.sleep(0.1)
+            ready = self.event_buffer.wait_ready()
+            if self.config.log.accepted_events and len(ready) > 1:
+                self.prompter.procsay(
+                    "Watcher",
+                    f"Dispatching {len(ready)} events "
+                    f"(buffered: {self.event_buffer.size}, high-water: {self.event_buffer.high_water})",
+                )
+
+            self._callback(ready)
 
     # -- Impl. of FileSystemEventHandler --
 
     def on_any_event(self, event):
         """Callback from Observer.
 
-        If there is an identical event in buffer, it's ignored.
+        If there is an event with the same path and type in buffer, it's ignored.
         """
-        if event in self.event_buffer.events():
+        if not self.event_buffer.push(event):
             if self.config.log.ignored_events:
                 self.prompter.ignore("Watcher", "ratelimit", event)
             return
         if self.config.log.accepted_events:
             self.prompter.accept(event)
-
-        self.event_buffer.push(event)
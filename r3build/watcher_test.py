@@ -0,0 +1,47 @@
+import threading
+import time
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+from r3build.watcher import EventBuffer
+
+
+def test_wait_ready():
+    buf = EventBuffer(0.1)
+    ev = FileModifiedEvent('/tmp/foo')
+
+    def _push():
+        time.sleep(0.05)
+        buf.push(ev)
+
+    threading.Thread(target=_push).start()
+
+    start = time.monotonic()
+    ready = buf.wait_ready()
+    elapsed = time.monotonic() - start
+
+    assert [e for e, _ in ready] == [ev]
+    assert 0.15 <= elapsed < 0.5
+    assert len(buf) == 0
+
+
+def test_coalesce_and_drain():
+    buf = EventBuffer(10)
+
+    assert buf.push(FileModifiedEvent('/tmp/foo'))
+    assert not buf.push(FileModifiedEvent('/tmp/foo'))
+    assert buf.push(FileCreatedEvent('/tmp/foo'))
+    assert buf.push(FileModifiedEvent('/tmp/bar'))
+    assert FileModifiedEvent('/tmp/foo') in buf
+    assert buf.size == 3
+    assert buf.high_water == 3
+
+    assert buf.drain_ready(time.monotonic()) == []
+    ready = buf.drain_ready(buf.next_deadline())
+    assert [e for e, _ in ready] == [FileModifiedEvent('/tmp/foo')]
+
+    ready = buf.drain_ready(time.monotonic() + 10)
+    assert [e.src_path for e, _ in ready] == ['/tmp/foo', '/tmp/bar']
+    assert buf.size == 0
+    assert buf.high_water == 3
+    assert buf.next_deadline() is None